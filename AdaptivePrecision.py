@@ -0,0 +1,133 @@
+""" simulates cohorts until the confidence intervals of mean costs are precise enough
+
+instead of simulating a fixed population size, patients are simulated in batches and the running
+means and confidence intervals of the cost of each cohort (and of the incremental cost of each
+cohort with respect to the first one) are updated after every batch; the simulation stops once
+all intervals are narrower than the target or the patient budget is used up.
+patient i of a cohort receives the same random numbers whatever the batch size, so the patients
+simulated are the first patients of a cohort of max_pop_size patients.
+"""
+import numpy as np
+import scipy.stats as stat
+import InputData as D
+import MarkovModelClasses as Cls
+import OnlineStatClasses as OnlineStat
+
+
+class AdaptiveMultiCohort:
+    def __init__(self, ids, parameters, max_pop_size, batch_size=500, min_pop_size=None,
+                 rel_half_width=None, abs_half_width=None, alpha=D.ALPHA, vectorized=True, seed=0):
+        """
+        :param ids: (list) IDs of cohorts to simulate (cohorts with the same id receive common
+                    random numbers, so their incremental costs are calculated from paired differences)
+        :param parameters: (list) parameters of each cohort
+        :param max_pop_size: maximum number of patients to simulate in each cohort (the patient budget)
+        :param batch_size: number of patients of each cohort simulated between checks of precision
+        :param min_pop_size: number of patients to simulate before precision is checked (batch_size if None)
+        :param rel_half_width: (optional) target half-width of confidence intervals relative to the
+                               absolute value of the mean (e.g. 0.01 for 1%)
+        :param abs_half_width: (optional) target half-width of confidence intervals
+                               (the simulation stops when either target is met)
+        :param alpha: significance level of confidence intervals
+        :param vectorized: set to True to simulate patients with the batch engine
+        :param seed: seed of the random number streams of patients of all cohorts
+        """
+        if rel_half_width is None and abs_half_width is None:
+            raise ValueError('A relative or absolute target half-width should be specified.')
+
+        self.ids = ids
+        self.parameters = parameters
+        self.maxPopSize = max_pop_size
+        self.batchSize = batch_size
+        self.minPopSize = batch_size if min_pop_size is None else min_pop_size
+        self.relHalfWidth = rel_half_width
+        self.absHalfWidth = abs_half_width
+        self.alpha = alpha
+        self.vectorized = vectorized
+        self.seed = seed
+
+        self.popSize = 0    # number of patients simulated in each cohort so far
+        self.ifConverged = False
+        # running statistics of the cost of each cohort
+        self.statCosts = [OnlineStat.OnlineSummaryStat('Discounted cost') for _ in ids]
+        # running statistics of paired differences in cost with respect to the first cohort
+        # (for cohorts that share random numbers with the first cohort)
+        self.statPairedIncCosts = [OnlineStat.OnlineSummaryStat('Increase in discounted cost')
+                                   if ids[i] == ids[0] else None for i in range(1, len(ids))]
+        self.cohortOutcomes = []  # outcomes of simulated patients of each cohort (CohortOutcomes)
+
+    def simulate(self, n_time_steps):
+        """ simulates batches of patients until the target precision or the patient budget is reached
+        :param n_time_steps: number of time steps to simulate each cohort
+        """
+        batches = [[] for _ in self.ids]  # outcome arrays of the batches of each cohort
+
+        while self.popSize < self.maxPopSize:
+            end = min(self.popSize + self.batchSize, self.maxPopSize)
+
+            costs = []
+            for i, (cohort_id, params) in enumerate(zip(self.ids, self.parameters)):
+                # simulate the next patients of the cohort
+                cohort = Cls.Cohort(id=cohort_id, pop_size=self.maxPopSize, parameters=params,
+                                    vectorized=self.vectorized, seed=self.seed)
+                cohort.simulate(n_time_steps=n_time_steps, first_patient=self.popSize, last_patient=end)
+
+                outcomes = cohort.cohortOutcomes
+                batches[i].append((outcomes.patientSurvivalTimes, outcomes.costs, outcomes.numPatientsAlive))
+                self.statCosts[i].record_batch(outcomes.costs)
+                costs.append(outcomes.costs)
+
+            for i, stat_inc_cost in enumerate(self.statPairedIncCosts, start=1):
+                if stat_inc_cost is not None:
+                    stat_inc_cost.record_batch(costs[i] - costs[0])
+
+            self.popSize = end
+            if self.popSize >= self.minPopSize and self.__if_precise():
+                self.ifConverged = True
+                break
+
+        # outcomes of all simulated patients
+        self.cohortOutcomes = []
+        for cohort_batches in batches:
+            outcomes = Cls.CohortOutcomes()
+            outcomes.record_outcomes(survival_times=np.concatenate([b[0] for b in cohort_batches]),
+                                     costs=np.concatenate([b[1] for b in cohort_batches]),
+                                     num_patients_alive=np.concatenate([b[2] for b in cohort_batches]))
+            self.cohortOutcomes.append(outcomes)
+
+    def get_cost_half_widths(self):
+        """ :returns (list) half-width of the confidence interval of the mean cost of each cohort """
+        return [s.get_t_half_length(alpha=self.alpha) for s in self.statCosts]
+
+    def get_incremental_cost(self, index):
+        """ :returns (mean, half-width of confidence interval) of the increase in the mean cost
+        of a cohort with respect to the first cohort
+        :param index: index of the cohort (> 0)
+        """
+        stat_inc_cost = self.statPairedIncCosts[index - 1]
+        if stat_inc_cost is not None:
+            # paired differences (common random numbers)
+            return stat_inc_cost.get_mean(), stat_inc_cost.get_t_half_length(alpha=self.alpha)
+
+        # independent cohorts
+        stat_x, stat_ref = self.statCosts[index], self.statCosts[0]
+        n_x, n_ref = stat_x.get_n(), stat_ref.get_n()
+        if min(n_x, n_ref) < 2:
+            return np.nan, np.nan
+        st_error = np.sqrt(stat_x.get_variance() / n_x + stat_ref.get_variance() / n_ref)
+        half_width = stat.t.ppf(1 - self.alpha / 2, min(n_x, n_ref) - 1) * st_error
+        return stat_x.get_mean() - stat_ref.get_mean(), half_width
+
+    def __if_precise(self):
+        """ :returns True if the confidence intervals of mean costs and incremental costs meet the target """
+        estimates = [(s.get_mean(), s.get_t_half_length(alpha=self.alpha)) for s in self.statCosts]
+        estimates += [self.get_incremental_cost(index=i) for i in range(1, len(self.ids))]
+
+        for mean, half_width in estimates:
+            if np.isnan(half_width):
+                return False
+            if_abs_met = self.absHalfWidth is not None and half_width <= self.absHalfWidth
+            if_rel_met = self.relHalfWidth is not None and half_width <= self.relHalfWidth * abs(mean)
+            if not (if_abs_met or if_rel_met):
+                return False
+        return True
@@ -0,0 +1,199 @@
+""" benchmarks of the simulation and analysis pipeline
+
+times the construction and simulation of cohorts, the extraction of outcomes and the Support
+reporting functions over a range of population sizes and simulation lengths, records the peak
+memory of each phase, and writes the results to a json file that can be compared between versions
+
+usage:
+    python Benchmark.py --pop-sizes 1000 10000 100000 1000000 --sim-lengths 10 50 --output new.json
+    python Benchmark.py --compare old.json new.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')   # figures are drawn but not shown
+import matplotlib.pyplot as plt
+import numpy as np
+import InputData as D
+import ParameterClasses as P
+import MarkovModelClasses as Cls
+import Support as Support
+
+ENGINES = ['patient', 'streaming', 'vectorized']
+
+
+class Benchmark:
+    """ records the wall time and peak memory of phases of the pipeline """
+    def __init__(self, repeats=1, if_measure_memory=True):
+        """
+        :param repeats: number of times each phase is timed (the minimum time is reported)
+        :param if_measure_memory: set to True to measure the peak memory of each phase
+                                  (in a separate run, since tracing memory slows down the code)
+        """
+        self.repeats = repeats
+        self.ifMeasureMemory = if_measure_memory
+        self.results = []
+
+    def measure(self, phase, func, setup=None, **info):
+        """ measures the time and peak memory of a phase
+        :param phase: name of the phase
+        :param func: function (with no arguments) to run the phase; it receives the result of setup if given
+        :param setup: (optional) function that prepares the input of func (not timed)
+        :param info: other information to record with the results (engine, population size, etc.)
+        :returns the value returned by the last call to func
+        """
+        seconds = np.inf
+        value = None
+        for r in range(self.repeats):
+            arg = setup() if setup is not None else None
+            start = time.perf_counter()
+            value = func(arg) if setup is not None else func()
+            seconds = min(seconds, time.perf_counter() - start)
+
+        peak_bytes = None
+        if self.ifMeasureMemory:
+            arg = setup() if setup is not None else None
+            tracemalloc.start()
+            value = func(arg) if setup is not None else func()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        result = dict(info, phase=phase, seconds=seconds, peak_bytes=peak_bytes)
+        self.results.append(result)
+        print('{:<45} {:<11} pop={:<9} steps={:<5} {:10.4f}s'.format(
+            phase, info.get('engine', ''), info.get('pop_size', ''), info.get('sim_length', ''), seconds)
+              + ('' if peak_bytes is None else '  {:10.1f}MB'.format(peak_bytes / 1e6)))
+        return value
+
+    def run_cohorts(self, engine, pop_size, sim_length):
+        """ benchmarks simulating one cohort per therapy with the specified engine
+        :returns (list) outcomes of the simulated cohorts """
+        info = dict(engine=engine, pop_size=pop_size, sim_length=sim_length)
+        vectorized = engine == 'vectorized'
+        streaming = engine == 'streaming'
+
+        outcomes = []
+        for cohort_id, therapy in enumerate(P.Therapies):
+            params = P.ParametersFixed(therapy=therapy)
+            info['therapy'] = therapy.name
+
+            def create_cohort():
+                return Cls.Cohort(id=cohort_id, pop_size=pop_size, parameters=params,
+                                  vectorized=vectorized, streaming=streaming)
+
+            def simulate(cohort):
+                cohort.simulate(n_time_steps=sim_length)
+                return cohort
+
+            self.measure('Cohort.__init__', create_cohort, **info)
+            cohort = self.measure('Cohort.simulate', simulate, setup=create_cohort, **info)
+
+            # extracting outcomes of simulated patients (cohorts do not keep their patients,
+            # so the patients are simulated here)
+            if engine == 'patient':
+                patients = [Cls.Patient(id=cohort_id * pop_size + i, parameters=params, cohort_id=cohort_id)
+                            for i in range(pop_size)]
+                for patient in patients:
+                    patient.simulate(n_time_steps=sim_length)
+                self.measure('CohortOutcomes.extract_outcomes',
+                             lambda: Cls.CohortOutcomes().extract_outcomes(simulated_patients=patients),
+                             **info)
+
+            outcomes.append(cohort.cohortOutcomes)
+
+        return outcomes
+
+    def run_reports(self, outcomes_amino, outcomes_immuno, engine, pop_size, sim_length):
+        """ benchmarks the Support reporting functions """
+        info = dict(engine=engine, pop_size=pop_size, sim_length=sim_length)
+
+        reports = [
+            ('Support.print_outcomes',
+             lambda: Support.print_outcomes(sim_outcomes=outcomes_amino,
+                                            therapy_name=P.Therapies.AMINOSALICYLATE)),
+        ]
+        # the streaming engine does not keep the outcomes of individual patients
+        if engine != 'streaming':
+            reports += [
+                ('Support.plot_survival_curves_and_histograms',
+                 lambda: Support.plot_survival_curves_and_histograms(sim_outcomes_amino=outcomes_amino,
+                                                                     sim_outcomes_immuno=outcomes_immuno)),
+                ('Support.print_comparative_outcomes',
+                 lambda: Support.print_comparative_outcomes(sim_outcomes_amino=outcomes_amino,
+                                                            sim_outcomes_immuno=outcomes_immuno)),
+                ('Support.report_CEA_CBA',
+                 lambda: Support.report_CEA_CBA(sim_outcomes_amino=outcomes_amino,
+                                                sim_outcomes_immuno=outcomes_immuno)),
+            ]
+
+        for phase, report in reports:
+            def run_report(func=report):
+                # reports are printed and drawn but not shown
+                with contextlib.redirect_stdout(io.StringIO()):
+                    func()
+                plt.close('all')
+            self.measure(phase, run_report, **info)
+
+    def write(self, file_name):
+        """ writes the results to a json file """
+        output = dict(
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            results=self.results)
+        with open(file_name, 'w') as file:
+            json.dump(output, file, indent=1, sort_keys=True)
+
+
+def compare(old_file_name, new_file_name):
+    """ prints the ratio of new to old times (and peak memory) of phases found in both results files """
+    def read(file_name):
+        with open(file_name) as file:
+            results = json.load(file)['results']
+        return {(r['phase'], r['engine'], r['pop_size'], r['sim_length'], r.get('therapy')): r for r in results}
+
+    old = read(old_file_name)
+    new = read(new_file_name)
+    for key in sorted(set(old) & set(new), key=str):
+        ratio_time = new[key]['seconds'] / old[key]['seconds'] if old[key]['seconds'] > 0 else np.nan
+        text = '{:<45} {:<11} pop={:<9} steps={:<5} {:<17} time x{:.2f}'.format(*key[:4], str(key[4]), ratio_time)
+        if old[key].get('peak_bytes') and new[key].get('peak_bytes') is not None:
+            text += '  memory x{:.2f}'.format(new[key]['peak_bytes'] / old[key]['peak_bytes'])
+        print(text)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the Markov model.')
+    parser.add_argument('--pop-sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--sim-lengths', type=int, nargs='+', default=[D.SIM_LENGTH])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--max-object-pop-size', type=int, default=100000,
+                        help='largest population simulated with the patient and streaming engines')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+    parser.add_argument('--no-reports', action='store_true', help='do not benchmark Support functions')
+    parser.add_argument('--output', default='BenchmarkResults.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        compare(old_file_name=args.compare[0], new_file_name=args.compare[1])
+    else:
+        benchmark = Benchmark(repeats=args.repeats, if_measure_memory=not args.no_memory)
+        for sim_length in args.sim_lengths:
+            for pop_size in args.pop_sizes:
+                for engine in args.engines:
+                    if engine != 'vectorized' and pop_size > args.max_object_pop_size:
+                        continue
+                    outcomes = benchmark.run_cohorts(engine=engine, pop_size=pop_size, sim_length=sim_length)
+                    if not args.no_reports:
+                        benchmark.run_reports(outcomes_amino=outcomes[0], outcomes_immuno=outcomes[1],
+                                              engine=engine, pop_size=pop_size, sim_length=sim_length)
+        benchmark.write(file_name=args.output)
@@ -0,0 +1,136 @@
+""" bootstrap percentile intervals of means, differences of means and ratios of differences
+
+replicates are drawn in blocks: each block of replicates has its own random number generator
+(spawned from the seed), so results only depend on the seed and not on the number of worker
+processes; within a block, the indices of resampled observations of many replicates are drawn
+together as a matrix (with the number of rows limited to bound memory).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import InputData as D
+
+# maximum number of resampled indices drawn at once
+MAX_INDICES = 2 ** 23
+
+
+class Bootstrap:
+    def __init__(self, n_replicates=10000, alpha=D.ALPHA, seed=0, n_workers=None, block_size=100):
+        """
+        :param n_replicates: number of bootstrap replicates
+        :param alpha: significance level of intervals
+        :param seed: seed of random number generators (the same seed gives the same intervals)
+        :param n_workers: number of worker processes (None uses all cores, 1 resamples in this process)
+        :param block_size: number of replicates that share a random number generator
+        """
+        self.nReplicates = n_replicates
+        self.alpha = alpha
+        self.seed = seed
+        self.nWorkers = n_workers
+        self.blockSize = block_size
+
+    def get_replicate_means(self, arrays, stream=0):
+        """ :returns (array of shape (replicates, arrays)) means of the arrays in each bootstrap replicate
+        (all arrays are resampled with the same indices, so paired observations stay paired)
+        :param arrays: (list) arrays of observations of the same length
+        :param stream: index of the random number stream (for independent resamples of the same seed)
+        """
+        arrays = np.atleast_2d(np.asarray(arrays, dtype=float))
+
+        # a random number generator for each block of replicates
+        n_blocks = -(-self.nReplicates // self.blockSize)
+        seeds = np.random.SeedSequence(entropy=self.seed, spawn_key=(stream,)).spawn(n_blocks)
+        sizes = [min(self.blockSize, self.nReplicates - b * self.blockSize) for b in range(n_blocks)]
+
+        if self.nWorkers == 1:
+            means = [_get_block_means(arrays, seeds, sizes)]
+        else:
+            # send a group of blocks to each worker (arrays are sent to a worker only once)
+            n_groups = os.cpu_count() if self.nWorkers is None else self.nWorkers
+            groups = np.array_split(np.arange(n_blocks), n_groups)
+            with ProcessPoolExecutor(max_workers=n_groups) as executor:
+                futures = [executor.submit(_get_block_means, arrays,
+                                           [seeds[b] for b in group], [sizes[b] for b in group])
+                           for group in groups if len(group) > 0]
+                means = [future.result() for future in futures]
+
+        return np.concatenate(means)
+
+    def get_mean_interval(self, x):
+        """ :returns (mean, lower bound, upper bound) of the bootstrap percentile interval of the mean
+        :param x: (array) observations
+        """
+        replicates = self.get_replicate_means([x])[:, 0]
+        return (np.mean(x),) + self.__get_percentiles(replicates)
+
+    def get_difference_interval(self, x, y_ref, if_paired=False):
+        """ :returns (mean, lower bound, upper bound) of the bootstrap percentile interval of the
+        difference in means (x - y_ref)
+        :param x: (array) observations
+        :param y_ref: (array) observations of the reference
+        :param if_paired: set to True if observations are paired (e.g. common random numbers)
+        """
+        x = np.asarray(x, dtype=float)
+        y_ref = np.asarray(y_ref, dtype=float)
+        if if_paired:
+            replicates = self.get_replicate_means([x - y_ref])[:, 0]
+        else:
+            # x and y_ref are resampled independently
+            replicates = self.get_replicate_means([x], stream=0)[:, 0] \
+                - self.get_replicate_means([y_ref], stream=1)[:, 0]
+        return (x.mean() - y_ref.mean(),) + self.__get_percentiles(replicates)
+
+    def get_ratio_interval(self, x_costs, x_effects, y_costs, y_effects, if_paired=False):
+        """ :returns (ratio, lower bound, upper bound) of the bootstrap percentile interval of the ratio
+        of the difference in mean costs to the difference in mean effects (ICER) of x with respect to y
+        :param x_costs: (array) costs of x
+        :param x_effects: (array) effects of x
+        :param y_costs: (array) costs of the reference
+        :param y_effects: (array) effects of the reference
+        :param if_paired: set to True if observations are paired (e.g. common random numbers)
+        """
+        x_costs, x_effects, y_costs, y_effects = (np.asarray(a, dtype=float)
+                                                  for a in (x_costs, x_effects, y_costs, y_effects))
+        if if_paired:
+            means = self.get_replicate_means([x_costs - y_costs, x_effects - y_effects])
+            d_costs, d_effects = means[:, 0], means[:, 1]
+        else:
+            means_x = self.get_replicate_means([x_costs, x_effects], stream=0)
+            means_y = self.get_replicate_means([y_costs, y_effects], stream=1)
+            d_costs, d_effects = means_x[:, 0] - means_y[:, 0], means_x[:, 1] - means_y[:, 1]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = (x_costs.mean() - y_costs.mean()) / (x_effects.mean() - y_effects.mean())
+            replicates = d_costs / d_effects
+        return (ratio,) + self.__get_percentiles(replicates)
+
+    def __get_percentiles(self, replicates):
+        """ :returns (lower, upper) percentiles of replicates """
+        lower, upper = np.percentile(replicates, [100 * self.alpha / 2, 100 * (1 - self.alpha / 2)])
+        return lower, upper
+
+
+def _get_block_means(arrays, seeds, sizes):
+    """ :returns (array of shape (replicates, arrays)) means of the arrays in the replicates of blocks
+    (in a worker process)
+    :param arrays: (array of shape (arrays, observations)) observations
+    :param seeds: (list) SeedSequence of each block
+    :param sizes: (list) number of replicates of each block
+    """
+    n = arrays.shape[1]
+    index_dtype = np.int32 if n < 2 ** 31 else np.int64
+    # number of replicates whose indices are drawn at once
+    n_rows = max(1, MAX_INDICES // n)
+
+    means = np.empty((sum(sizes), len(arrays)))
+    row = 0
+    for seed, size in zip(seeds, sizes):
+        rng = np.random.default_rng(seed)
+        for start in range(0, size, n_rows):
+            n_reps = min(n_rows, size - start)
+            # indices of resampled observations of these replicates (one row per replicate)
+            indices = rng.integers(0, n, size=(n_reps, n), dtype=index_dtype)
+            for a, array in enumerate(arrays):
+                means[row:row + n_reps, a] = array[indices].mean(axis=1)
+            row += n_reps
+    return means
@@ -0,0 +1,149 @@
+""" cost-effectiveness and cost-benefit analyses on arrays of costs and effects
+(calculations over all willingness-to-pay values are done together instead of one value at a time) """
+import numpy as np
+import scipy.stats as stat
+
+# maximum number of elements of temporary arrays (calculations over many willingness-to-pay values
+# and observations are done in blocks of willingness-to-pay values to bound memory)
+MAX_BLOCK_ELEMENTS = 2 ** 24
+
+
+def get_frontier(mean_costs, mean_effects):
+    """ finds strategies on the cost-effectiveness frontier (strategies that are not dominated
+    or extendedly dominated)
+    :param mean_costs: (array) mean cost of each strategy
+    :param mean_effects: (array) mean effect of each strategy
+    :returns (indices of strategies on the frontier in the order of increasing effect,
+              ICER of each strategy on the frontier with respect to the previous one (nan for the first))
+    """
+    mean_costs = np.asarray(mean_costs, dtype=float)
+    mean_effects = np.asarray(mean_effects, dtype=float)
+
+    # the frontier starts with the least costly strategy (the most effective one if there are ties)
+    current = np.lexsort((-mean_effects, mean_costs))[0]
+    frontier = [current]
+    icers = [np.nan]
+
+    while True:
+        # strategies that are more effective than the last strategy on the frontier
+        candidates = np.flatnonzero(mean_effects > mean_effects[current])
+        if len(candidates) == 0:
+            break
+
+        # the next strategy on the frontier has the lowest ICER with respect to the last one
+        # (strategies with higher ICERs are dominated or extendedly dominated)
+        candidate_icers = (mean_costs[candidates] - mean_costs[current]) \
+            / (mean_effects[candidates] - mean_effects[current])
+        best = candidate_icers.min()
+        # among strategies with the same ICER, the most effective one
+        ties = candidates[candidate_icers == best]
+        current = ties[np.argmax(mean_effects[ties])]
+
+        frontier.append(current)
+        icers.append(best)
+
+    return np.array(frontier), np.array(icers)
+
+
+def get_icers(mean_costs, mean_effects):
+    """ :returns (array) ICER of each strategy with respect to the previous strategy on the frontier
+    (nan for the first strategy on the frontier and strategies not on the frontier)
+    :param mean_costs: (array) mean cost of each strategy
+    :param mean_effects: (array) mean effect of each strategy
+    """
+    frontier, frontier_icers = get_frontier(mean_costs=mean_costs, mean_effects=mean_effects)
+    icers = np.full(len(mean_costs), np.nan)
+    icers[frontier] = frontier_icers
+    return icers
+
+
+def get_incremental_nmb(costs, effects, ref_costs, ref_effects, wtp_values,
+                        if_paired=False, interval_type='c', alpha=0.05):
+    """ calculates the incremental net monetary benefit (wtp * incremental effect - incremental cost)
+    of a strategy with respect to a reference strategy at all willingness-to-pay values
+    :param costs: (array) observed costs of the strategy
+    :param effects: (array) observed effects of the strategy
+    :param ref_costs: (array) observed costs of the reference strategy
+    :param ref_effects: (array) observed effects of the reference strategy
+    :param wtp_values: (array) willingness-to-pay values
+    :param if_paired: set to True if observations of the two strategies are paired
+                      (e.g. simulated with common random numbers, or PSA iterations)
+    :param interval_type: 'c' for confidence intervals, 'p' for percentile intervals (requires paired observations)
+    :param alpha: significance level
+    :returns (means, lower bounds, upper bounds) of the incremental net monetary benefit at each wtp value
+    """
+    wtp_values = np.asarray(wtp_values, dtype=float)
+    costs = np.asarray(costs, dtype=float)
+    effects = np.asarray(effects, dtype=float)
+    ref_costs = np.asarray(ref_costs, dtype=float)
+    ref_effects = np.asarray(ref_effects, dtype=float)
+
+    if interval_type == 'p':
+        if not if_paired:
+            raise ValueError('Percentile intervals require paired observations.')
+        # incremental net monetary benefit of each observation at each wtp value
+        d_effects = effects - ref_effects
+        d_costs = costs - ref_costs
+        means = np.empty(len(wtp_values))
+        bounds = np.empty((2, len(wtp_values)))
+        for block in _get_blocks(n_values=len(wtp_values), n_elements_per_value=len(d_costs)):
+            nmbs = wtp_values[block, np.newaxis] * d_effects[np.newaxis, :] - d_costs[np.newaxis, :]
+            means[block] = nmbs.mean(axis=1)
+            bounds[:, block] = np.percentile(nmbs, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=1)
+        return means, bounds[0], bounds[1]
+
+    elif interval_type == 'c':
+        # the mean and variance of (wtp * effect - cost) are quadratic functions of wtp,
+        # so they are calculated from the means, variances and covariance of costs and effects
+        if if_paired:
+            d_effects = effects - ref_effects
+            d_costs = costs - ref_costs
+            n = len(d_costs)
+            mean_effect, mean_cost = d_effects.mean(), d_costs.mean()
+            cov = np.cov(d_effects, d_costs) / n
+            df = n - 1
+        else:
+            mean_effect = effects.mean() - ref_effects.mean()
+            mean_cost = costs.mean() - ref_costs.mean()
+            cov = np.cov(effects, costs) / len(costs) + np.cov(ref_effects, ref_costs) / len(ref_costs)
+            df = min(len(costs), len(ref_costs)) - 1
+
+        means = wtp_values * mean_effect - mean_cost
+        variances = wtp_values ** 2 * cov[0, 0] - 2 * wtp_values * cov[0, 1] + cov[1, 1]
+        half_lengths = stat.t.ppf(1 - alpha / 2, df) * np.sqrt(np.maximum(variances, 0))
+        return means, means - half_lengths, means + half_lengths
+
+    else:
+        raise ValueError("Interval type should be 'c' or 'p'.")
+
+
+def get_acceptability_curves(costs, effects, wtp_values):
+    """ calculates cost-effectiveness acceptability curves from PSA iterations
+    :param costs: (array of shape (strategies, iterations)) mean cost of each strategy in each iteration
+    :param effects: (array of shape (strategies, iterations)) mean effect of each strategy in each iteration
+    :param wtp_values: (array) willingness-to-pay values
+    :returns (array of shape (strategies, wtp values)) probability that each strategy has the
+             highest net monetary benefit at each wtp value
+    """
+    costs = np.asarray(costs, dtype=float)
+    effects = np.asarray(effects, dtype=float)
+    wtp_values = np.asarray(wtp_values, dtype=float)
+    n_strategies, n_iterations = costs.shape
+
+    probs = np.empty((n_strategies, len(wtp_values)))
+    for block in _get_blocks(n_values=len(wtp_values), n_elements_per_value=costs.size):
+        # net monetary benefit of each strategy in each iteration (wtp values, strategies, iterations)
+        nmbs = wtp_values[block, np.newaxis, np.newaxis] * effects[np.newaxis] - costs[np.newaxis]
+        # number of iterations in which each strategy has the highest net monetary benefit
+        best = nmbs.argmax(axis=1)
+        counts = (best[:, np.newaxis, :] == np.arange(n_strategies)[np.newaxis, :, np.newaxis]).sum(axis=2)
+        probs[:, block] = counts.T / n_iterations
+
+    return probs
+
+
+def _get_blocks(n_values, n_elements_per_value):
+    """ :returns slices that split n_values willingness-to-pay values into blocks
+    (so that temporary arrays have at most MAX_BLOCK_ELEMENTS elements) """
+    block_size = max(1, MAX_BLOCK_ELEMENTS // max(1, n_elements_per_value))
+    return [slice(start, min(start + block_size, n_values)) for start in range(0, n_values, block_size)]
@@ -0,0 +1,47 @@
+""" checkpoints of long cohort simulations
+
+the progress of a simulation (outcomes of patients simulated so far and, with the batch engine,
+the state of the chunk being simulated) is saved to a .npz file every few chunks or time-steps, so
+a simulation that is interrupted can be resumed from the last checkpoint.
+since each patient's random numbers are found from the patient's key and a counter (the time-step,
+or the number of sampled sojourns), resumed simulations give exactly the same results.
+"""
+import os
+import numpy as np
+
+
+class Checkpoint:
+    def __init__(self, file_name, chunk_interval=1, time_step_interval=None):
+        """
+        :param file_name: name of the .npz file to save the checkpoint to (and to resume from if it exists)
+        :param chunk_interval: number of chunks of patients simulated between checkpoints
+        :param time_step_interval: (optional) number of time-steps (or sojourns with sojourn sampling)
+                                   simulated between checkpoints within a chunk (only supported by the
+                                   batch engine; Cohort.simulate raises a ValueError for the
+                                   object-per-patient engine, which saves checkpoints between chunks only)
+        """
+        self.fileName = file_name
+        self.chunkInterval = chunk_interval
+        self.timeStepInterval = time_step_interval
+
+    def save(self, **arrays):
+        """ saves the arrays to the checkpoint file (replaces the previous checkpoint only after
+        the new one is completely written, so an interruption while saving keeps the previous one) """
+        folder = os.path.dirname(os.path.abspath(self.fileName))
+        os.makedirs(folder, exist_ok=True)
+
+        temp_file_name = self.fileName + '.tmp.npz'
+        np.savez(temp_file_name, **arrays)
+        os.replace(temp_file_name, self.fileName)
+
+    def load(self):
+        """ :returns (dictionary) arrays of the checkpoint, or None if there is no checkpoint """
+        if not os.path.exists(self.fileName):
+            return None
+        with np.load(self.fileName) as saved:
+            return {name: saved[name] for name in saved.files}
+
+    def remove(self):
+        """ removes the checkpoint file (once the simulation is complete) """
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
@@ -1,41 +1,75 @@
 import InputData as D
+import AdaptivePrecision as Adaptive
 import ParameterClasses as P
 import MarkovModelClasses as Cls
+import ResultCache as Cache
 import Support as Support
 
 
-# print(Cls.CohortOutcomes.numPatientsAlive)
-# simulating amino therapy
-# create a cohort
-cohort_amino = Cls.Cohort(id=0,
-                         pop_size=D.POP_SIZE,
-                         parameters=P.ParametersFixed(therapy=P.Therapies.AMINOSALICYLATE))
-# simulate the cohort
-cohort_amino.simulate(n_time_steps=D.SIM_LENGTH)
-
-# simulating immuno therapy
-# create a cohort
-cohort_immuno = Cls.Cohort(id=1,
-                          pop_size=D.POP_SIZE,
-                          parameters=P.ParametersFixed(therapy=P.Therapies.IMMUNOSUPPRESIVE))
-# simulate the cohort
-cohort_immuno.simulate(n_time_steps=D.SIM_LENGTH)
-
-# print the estimates for the mean survival time and mean time to disease
-Support.print_outcomes(sim_outcomes=cohort_amino.cohortOutcomes,
-                       therapy_name=P.Therapies.AMINOSALICYLATE)
-Support.print_outcomes(sim_outcomes=cohort_immuno.cohortOutcomes,
-                       therapy_name=P.Therapies.IMMUNOSUPPRESIVE)
-
-# draw survival curves and histograms
-Support.plot_survival_curves_and_histograms(sim_outcomes_amino=cohort_amino.cohortOutcomes,
-                                            sim_outcomes_immuno=cohort_immuno.cohortOutcomes)
-
-
-# print comparative outcomes
-Support.print_comparative_outcomes(sim_outcomes_amino=cohort_amino.cohortOutcomes,
-                                   sim_outcomes_immuno=cohort_immuno.cohortOutcomes)
-
-# report the CEA results
-Support.report_CEA_CBA(sim_outcomes_amino=cohort_amino.cohortOutcomes,
-                       sim_outcomes_immuno=cohort_immuno.cohortOutcomes)
+if __name__ == '__main__':
+
+    # save figures to files (rendered in the background) instead of showing them
+    if D.HEADLESS_REPORTS:
+        Support.use_headless_reports(figure_dir=D.FIGURE_DIR)
+
+    # simulating amino therapy (cohort 0) and immuno therapy (cohort 1) in parallel
+    # (with common random numbers, both cohorts use id 0 so patient i receives the same random numbers)
+    ids = [0, 0] if D.COMMON_RANDOM_NUMBERS else [0, 1]
+    parameters = [P.ParametersFixed(therapy=P.Therapies.AMINOSALICYLATE, time_varying=D.TIME_VARYING),
+                  P.ParametersFixed(therapy=P.Therapies.IMMUNOSUPPRESIVE, time_varying=D.TIME_VARYING)]
+
+    if D.ADAPTIVE_PRECISION:
+        # simulate patients in batches until the confidence intervals of costs are precise enough
+        multi_cohort = Adaptive.AdaptiveMultiCohort(ids=ids, parameters=parameters,
+                                                    max_pop_size=D.MAX_POP_SIZE,
+                                                    batch_size=D.BATCH_SIZE,
+                                                    rel_half_width=D.TARGET_REL_HALF_WIDTH,
+                                                    seed=D.SEED)
+        multi_cohort.simulate(n_time_steps=D.SIM_LENGTH)
+        print('Population size of each cohort:', multi_cohort.popSize,
+              '' if multi_cohort.ifConverged else '(target precision not reached)')
+        print('')
+    else:
+        # create the cohorts
+        multi_cohort = Cls.MultiCohort(ids=ids,
+                                       pop_sizes=[D.POP_SIZE, D.POP_SIZE],
+                                       parameters=parameters,
+                                       seed=D.SEED)
+        # simulate the cohorts (outcomes of cohorts simulated before with the same inputs are loaded from the cache)
+        cache = None if D.RESULT_CACHE_DIR is None \
+            else Cache.ResultCache(cache_dir=D.RESULT_CACHE_DIR, max_size=D.RESULT_CACHE_SIZE)
+        multi_cohort.simulate(n_time_steps=D.SIM_LENGTH, cache=cache)
+
+    # outcomes of each therapy
+    outcomes_amino = multi_cohort.cohortOutcomes[0]
+    outcomes_immuno = multi_cohort.cohortOutcomes[1]
+
+    # print the estimates for the mean survival time and mean time to disease
+    Support.print_outcomes(sim_outcomes=outcomes_amino,
+                           therapy_name=P.Therapies.AMINOSALICYLATE)
+    Support.print_outcomes(sim_outcomes=outcomes_immuno,
+                           therapy_name=P.Therapies.IMMUNOSUPPRESIVE)
+
+    # draw survival curves and histograms
+    Support.plot_survival_curves_and_histograms(sim_outcomes_amino=outcomes_amino,
+                                                sim_outcomes_immuno=outcomes_immuno)
+
+    # print comparative outcomes
+    Support.print_comparative_outcomes(sim_outcomes_amino=outcomes_amino,
+                                       sim_outcomes_immuno=outcomes_immuno,
+                                       if_paired=D.COMMON_RANDOM_NUMBERS)
+
+    # print bootstrap percentile intervals (for skewed costs and ratios)
+    if D.BOOTSTRAP_INTERVALS:
+        print("")
+        Support.print_bootstrap_outcomes(sim_outcomes_amino=outcomes_amino,
+                                         sim_outcomes_immuno=outcomes_immuno,
+                                         if_paired=D.COMMON_RANDOM_NUMBERS)
+
+    # report the CEA results
+    Support.report_CEA_CBA(sim_outcomes_amino=outcomes_amino,
+                           sim_outcomes_immuno=outcomes_immuno,
+                           if_paired=D.COMMON_RANDOM_NUMBERS)
+
+    # wait for figures that are still being rendered
+    Support.wait_for_reports()
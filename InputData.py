@@ -4,9 +4,34 @@ POP_SIZE = 2000     # cohort population size
 SIM_LENGTH = 10   # length of simulation (years). this is 2 months
 ALPHA = 0.05        # significance level for calculating confidence intervals
 DISCOUNT = 0.05     # annual discount rate
+WTP_RANGE = (0, 50000)  # range of willingness-to-pay values for cost-benefit analyses
+N_WTP_VALUES = 501       # number of willingness-to-pay values in the range
+BOOTSTRAP_INTERVALS = False     # set to True to also report bootstrap percentile intervals
+BOOTSTRAP_N_REPLICATES = 10000  # number of bootstrap replicates
+BOOTSTRAP_SEED = 1              # seed of bootstrap resampling
+SEED = 0            # seed of the random number streams of patients (a run is reproducible for a given seed)
+COMMON_RANDOM_NUMBERS = False  # set to True to simulate both therapies with the same random numbers (paired)
+HEADLESS_REPORTS = False    # set to True to save figures to FIGURE_DIR (in the background) instead of showing them
+FIGURE_DIR = 'figures'      # folder to save figures to
+RESULT_CACHE_DIR = 'results_cache'   # folder to store simulated outcomes in (None to always simulate)
+RESULT_CACHE_SIZE = 500 * 2 ** 20    # (bytes) maximum size of stored outcomes
+ADAPTIVE_PRECISION = False  # set to True to simulate patients until confidence intervals of costs are precise enough
+TARGET_REL_HALF_WIDTH = 0.01  # target half-width of confidence intervals of mean (incremental) costs relative to means
+MAX_POP_SIZE = 100000       # maximum population size of each cohort (with adaptive precision)
+BATCH_SIZE = 1000           # number of patients simulated between checks of precision
+
+# scenario sweeps (see RunSweep.py)
+SWEEP_STORE_DIR = 'sweep_results'   # folder to store outcomes of cells of sweeps in
+SWEEP_DISCOUNT_RATES = [0, 0.03, 0.05]  # discount rates to sweep over
+SWEEP_SIM_LENGTHS = [10, 20, 40]        # simulation lengths to sweep over
 # annual probability of background mortality (number per year per 1,000 population)
 ANNUAL_PROB_BACKGROUND_MORT = 1.6/100   # according to https://www.ncbi.nlm.nih.gov/pmc/articles/PMC1856159/
 
+# time-varying transition probabilities (background mortality rising with age and a waning therapy effect)
+TIME_VARYING = False            # set to True to use transition probabilities that change over time-steps
+BACKGROUND_MORT_AGE_GROWTH = 0.085  # annual increase in the log hazard of background mortality (Gompertz)
+THERAPY_EFFECT_HALF_LIFE = 5    # (years) time for half of the effect of immunosuppresive therapy to wear off
+
 # transition matrix
 TRANS_MATRIX = [
     [0.89688, 0.07016, 0.00939, 0.00639, 0.00363, 0.00793, 0.00395, 0.00167],   # Remission  1
@@ -43,6 +68,12 @@ ANNUAL_STATE_COST = [
 Aminosalicylate_COST = 11467
 Immunosuppresive_COST = 5147
 
+# probabilistic sensitivity analysis
+PSA_N_ITERATIONS = 5000         # number of parameter sets to sample
+TRANS_MATRIX_SAMPLE_SIZE = 200  # number of observed transitions out of each state (for Dirichlet distributions)
+STATE_COST_CV = 0.25            # coefficient of variation of annual state costs (for gamma distributions)
+THERAPY_COST_CV = 0.1           # coefficient of variation of annual therapy costs (for gamma distributions)
+
 # # treatment relative risk
 # TREATMENT_RR = 0.509
 
@@ -1,174 +1,755 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import ParameterClasses as P
-import SimPy.RandomVariantGenerators as RVGs
-import SimPy.SamplePathClasses as Path
-import SimPy.EconEvalClasses as Econ
 import SimPy.StatisticalClasses as Stat
+import OnlineStatClasses as OnlineStat
+import RandomStreams as RS
+
+
+# index of the death state (health states are stored as integers during the simulation)
+DEATH = P.HealthStates.DEATH.value
 
 
 class Patient:
-    def __init__(self, id, parameters):
+    # slots instead of a __dict__ to reduce the memory of each patient
+    __slots__ = ('id', 'rngKey', 'params', 'stateMonitor')
+
+    def __init__(self, id, parameters, cohort_id=0, seed=0):
         """ initiates a patient
         :param id: ID of the patient
-        :param parameters: an instance of the parameters class
+        :param parameters: an instance of the parameters class (shared by all patients)
+        :param cohort_id: ID of the cohort of this patient
+        :param seed: seed of the random number streams
         """
         self.id = id
-        self.rng = RVGs.RNG(seed=id)
+        # key of this patient's random number stream (the k-th random number is a hash of the key and k)
+        self.rngKey = RS.get_patient_key(patient_id=id, cohort_id=cohort_id, seed=seed)
         self.params = parameters
         self.stateMonitor = PatientStateMonitor(parameters=parameters)
 
-    def simulate(self, n_time_steps):
-        """ simulate the patient over the specified simulation length """
+    def simulate(self, n_time_steps, sojourn_sampling=False, trajectory=None):
+        """ simulate the patient over the specified simulation length
+        :param n_time_steps: simulation length
+        :param sojourn_sampling: set to True to sample how long the patient stays in each state
+                                 (instead of sampling a transition every time-step)
+        :param trajectory: (optional) array to record the health state after each transition in
+                           (the state at the end of time-step k is stored at position k + 1)
+        """
+
+        # sojourn times are only geometric if transition probabilities do not change over time
+        if sojourn_sampling and not self.params.ifTimeVarying:
+            self.__simulate_sojourns(n_time_steps=n_time_steps, trajectory=trajectory)
+            return
 
         k = 0  # simulation time step
 
+        # make sure discount factors are calculated for all time-steps
+        self.params.get_discount_factors(n_time_steps=n_time_steps)
+
+        # cumulative transition probabilities of each time-step (if time-varying)
+        cum_prob_tensor = self.params.get_cum_prob_tensor(n_time_steps=n_time_steps) \
+            if self.params.ifTimeVarying else None
+
         # while the patient is alive and simulation length is not yet reached
         while self.stateMonitor.get_if_alive() and k < n_time_steps:
 
-            # find the transition probabilities to future states
-            trans_probs = self.params.probMatrix[self.stateMonitor.currentState.value]
-
-            # create an empirical distribution
-            empirical_dist = RVGs.Empirical(probabilities=trans_probs)
+            uniform = RS.get_uniform(key=self.rngKey, counter=k)
+            if cum_prob_tensor is None:
+                # find the sampler of transitions out of the current state
+                sampler = self.params.transitionSamplers[self.stateMonitor.currentState]
 
-            # sample from the empirical distribution to get a new state
-            # (returns an integer from {0, 1, 2, ...})
-            new_state_index = empirical_dist.sample(rng=self.rng)
+                # sample from the cached empirical distribution to get a new state
+                # (returns an integer from {0, 1, 2, ...})
+                new_state_index = sampler.sample(uniform=uniform)
+            else:
+                # sample from the transition probabilities of this time-step
+                new_state_index = int(cum_prob_tensor[k, self.stateMonitor.currentState]
+                                      .searchsorted(uniform, side='right'))
 
             # update health state
-            self.stateMonitor.update(time_step=k, new_state=P.HealthStates(new_state_index))
+            self.stateMonitor.update(time_step=k, new_state=new_state_index, parameters=self.params)
+            if trajectory is not None:
+                trajectory[k + 1] = new_state_index
 
             # increment time
             k += 1
 
+    def __simulate_sojourns(self, n_time_steps, trajectory):
+        """ simulate the patient by jumping from one change of health state to the next """
+
+        k = 0  # simulation time step
+        n_jumps = 0  # number of sojourns sampled so far (each uses two random numbers)
+
+        # make sure discount factors are calculated for all time-steps
+        self.params.get_discount_factors(n_time_steps=n_time_steps)
+
+        # while the patient is alive and simulation length is not yet reached
+        while self.stateMonitor.get_if_alive() and k < n_time_steps:
+
+            state = self.stateMonitor.currentState
+
+            # sample the number of time-steps the patient stays in the current state
+            # (geometric with the probability of staying; patients never leave absorbing states)
+            log_stay_prob = self.params.logStayProbs[state]
+            if log_stay_prob == 0:
+                n_stays = n_time_steps - k
+            else:
+                uniform = RS.get_uniform(key=self.rngKey, counter=2 * n_jumps)
+                n_stays = min(int(math.log1p(-uniform) / log_stay_prob), n_time_steps - k)
+
+            # stay in the current state
+            self.stateMonitor.stay(time_step=k, n_time_steps=n_stays, parameters=self.params)
+            k += n_stays
+
+            if k < n_time_steps:
+                # sample the next state from the transitions out of the current state
+                sampler = self.params.exitSamplers[state]
+                new_state_index = sampler.sample(uniform=RS.get_uniform(key=self.rngKey, counter=2 * n_jumps + 1))
+
+                # update health state
+                self.stateMonitor.update(time_step=k, new_state=new_state_index, parameters=self.params)
+                if trajectory is not None:
+                    trajectory[k + 1] = new_state_index
+                k += 1
+
+            n_jumps += 1
+
 
 class PatientStateMonitor:
     """ to update patient outcomes (years survived, cost, etc.) throughout the simulation """
+    __slots__ = ('currentState', 'survivalTime', 'numAlive', 'costUtilityMonitor')
+
     def __init__(self, parameters):
 
-        self.currentState = parameters.initialHealthState   # initial health state
+        self.currentState = parameters.initialHealthState.value   # index of the initial health state
         self.survivalTime = None      # survival time
         self.numAlive = 0
 
         # patient's cost and utility monitor
-        self.costUtilityMonitor = PatientCostUtilityMonitor(parameters=parameters)
+        self.costUtilityMonitor = PatientCostUtilityMonitor()
 
-    def update(self, time_step, new_state):
+    def update(self, time_step, new_state, parameters):
         """
         update the current health state to the new health state
         :param time_step: current time step
-        :param new_state: new state
+        :param new_state: index of the new state
+        :param parameters: parameters of this patient
         """
 
         # if the patient has died, do nothing
-        if self.currentState == P.HealthStates.DEATH:
+        if self.currentState == DEATH:
             return
 
         # update survival time
-        if new_state == P.HealthStates.DEATH:
+        if new_state == DEATH:
             self.survivalTime = time_step + 0.5  # corrected for the half-cycle effect
 
         # update cost and utility
         self.costUtilityMonitor.update(k=time_step,
                                        current_state=self.currentState,
-                                       next_state=new_state)
+                                       next_state=new_state,
+                                       parameters=parameters)
 
         # update current health state
         self.currentState = new_state
 
         # get number of patients alive count
-        if self.currentState != P.HealthStates.DEATH:
+        if self.currentState != DEATH:
             self.numAlive += 1
 
+    def stay(self, time_step, n_time_steps, parameters):
+        """
+        update the outcomes of a patient who stays in the current health state
+        :param time_step: current time step
+        :param n_time_steps: number of time-steps the patient stays in the current state
+        :param parameters: parameters of this patient
+        """
+
+        # if the patient has died, do nothing
+        if self.currentState == DEATH or n_time_steps == 0:
+            return
+
+        # update cost and utility
+        self.costUtilityMonitor.update_stay(k=time_step,
+                                            n_time_steps=n_time_steps,
+                                            state=self.currentState,
+                                            parameters=parameters)
+
+        # get number of patients alive count
+        self.numAlive += n_time_steps
+
     def get_if_alive(self):
         """ returns true if the patient is still alive """
-        if self.currentState != P.HealthStates.DEATH:
-            return True
-        else:
-            return False
-
+        return self.currentState != DEATH
 
 
 class PatientCostUtilityMonitor:
+    __slots__ = ('totalDiscountedCost',)
 
-    def __init__(self, parameters):
-
-        # model parameters for this patient
-        self.params = parameters
+    def __init__(self):
 
         # total cost and utility
         self.totalDiscountedCost = 0
         # self.totalDiscountedUtility = 0
 
-    def update(self, k, current_state, next_state):
+    def update(self, k, current_state, next_state, parameters):
         """ updates the discounted total cost and health utility
         :param k: simulation time step
-        :param current_state: current health state
-        :param next_state: next health state
+        :param current_state: index of the current health state
+        :param next_state: index of the next health state
+        :param parameters: parameters of this patient
         """
 
-        # update cost
-        cost = 0.5 * (self.params.annualStateCosts[current_state.value] +
-                      self.params.annualStateCosts[next_state.value])
-        # update utility
-        # utility = 0.5 * (self.params.annualStateUtilities[current_state.value] +
-        #                  self.params.annualStateUtilities[next_state.value])
-
-        # add the cost of treatment
-        # if Chron's death will occur, add the cost for half-year of treatment
-        if next_state == P.HealthStates.DEATH:
-            cost += 0.5 * self.params.annualTreatmentCost
-        else:
-            cost += 1 * self.params.annualTreatmentCost
-
         # update total discounted cost and utility (corrected for the half-cycle effect)
-        self.totalDiscountedCost += Econ.pv_single_payment(payment=cost,
-                                                           discount_rate=self.params.discountRate / 2,
-                                                           discount_period=2 * k + 1)
+        # cost of this transition (including the cost of treatment) and discount factors are precalculated
+        self.totalDiscountedCost += parameters.transitionCosts[current_state, next_state] \
+            * parameters.discountFactors[k]
+        # update utility
+        # utility = 0.5 * (parameters.annualStateUtilities[current_state] +
+        #                  parameters.annualStateUtilities[next_state])
         # self.totalDiscountedUtility += Econ.pv_single_payment(payment=utility,
-        #                                                       discount_rate=self.params.discountRate / 2,
+        #                                                       discount_rate=parameters.discountRate / 2,
         #                                                       discount_period=2 * k + 1)
 
+    def update_stay(self, k, n_time_steps, state, parameters):
+        """ updates the discounted total cost of staying in a health state for a number of time-steps
+        :param k: simulation time step
+        :param n_time_steps: number of time-steps the patient stays in the state
+        :param state: index of the health state
+        :param parameters: parameters of this patient
+        """
+        # the sum of discount factors of time-steps k, ..., k + n_time_steps - 1 is precalculated
+        self.totalDiscountedCost += parameters.transitionCosts[state, state] \
+            * (parameters.cumDiscountFactors[k + n_time_steps] - parameters.cumDiscountFactors[k])
+
 
 class Cohort:
-    def __init__(self, id, pop_size, parameters):
-        """ create a cohort of patients
+    def __init__(self, id, pop_size, parameters, vectorized=False, streaming=False, chunk_size=10000,
+                 sojourn_sampling=False, seed=0):
+        """ create a cohort of patients (patients are created in chunks during the simulation)
         :param id: cohort ID
         :param pop_size: population size of this cohort
         :param parameters: parameters
+        :param vectorized: set to True to simulate the patients of each chunk together with the batch engine
+                           (no Patient objects are created in this mode)
+        :param streaming: set to True to only keep running summary statistics of patients' outcomes
+                          (memory does not grow with pop_size)
+        :param chunk_size: number of patients created and simulated at a time (bounds the peak memory)
+        :param sojourn_sampling: set to True to sample how long patients stay in each state and jump to
+                                 the time-step they leave it (instead of sampling a transition every time-step)
+        :param seed: seed of the random number streams of patients (the same seed and cohort id
+                     give the same random numbers)
         """
         self.id = id
         self.initialPopSize = pop_size  # initial population size
-        self.patients = []  # list of patients
-        self.cohortOutcomes = CohortOutcomes()  # outcomes of the this simulated cohort
-
-        # populate the cohort
-        for i in range(pop_size):
-            # create a new patient (use id * pop_size + n as patient id)
-            patient = Patient(id=id * pop_size + i, parameters=parameters)
-            # add the patient to the cohort
-            self.patients.append(patient)
+        self.params = parameters
+        self.vectorized = vectorized
+        self.streaming = streaming
+        self.chunkSize = chunk_size
+        self.sojournSampling = sojourn_sampling
+        self.seed = seed
+
+        # outcomes of the this simulated cohort
+        if self.streaming:
+            self.cohortOutcomes = StreamingCohortOutcomes()
+        else:
+            self.cohortOutcomes = CohortOutcomes()
 
-    def simulate(self, n_time_steps):
+    def simulate(self, n_time_steps, first_patient=0, last_patient=None, checkpoint=None, trajectory_recorder=None):
         """ simulate the cohort of patients over the specified number of time-steps
         :param n_time_steps: number of time steps to simulate the cohort
+        :param first_patient: index of the first patient to simulate
+        :param last_patient: index after the last patient to simulate (None to simulate to the end of cohort)
+                             (simulating a range of patients allows a cohort to be split into shards;
+                             each patient receives the same random numbers regardless of the range)
+        :param checkpoint: (optional) Checkpoint to save the progress of the simulation to
+                           (the simulation resumes from the checkpoint file if it exists,
+                           and the file is removed once the simulation is complete)
+        :param trajectory_recorder: (optional) TrajectoryRecorder to write the health state of patients
+                                    at every time-step to (one row per patient of the simulated range)
         """
-        # simulate all patients
-        for patient in self.patients:
-            # simulate
-            patient.simulate(n_time_steps=n_time_steps)
+        if last_patient is None:
+            last_patient = self.initialPopSize
+
+        # the recorder should have a row for each simulated patient and the same number of time-steps
+        if trajectory_recorder is not None:
+            if trajectory_recorder.nTimeSteps != n_time_steps:
+                raise ValueError('The trajectory recorder has {} time-steps but {} time-steps are simulated.'
+                                 .format(trajectory_recorder.nTimeSteps, n_time_steps))
+            if trajectory_recorder.nPatients != last_patient - first_patient:
+                raise ValueError('The trajectory recorder has {} patients but {} patients are simulated.'
+                                 .format(trajectory_recorder.nPatients, last_patient - first_patient))
+
+        # outcomes of patients are stored in the order of patients in the simulated range
+        self.cohortOutcomes.allocate(n_patients=last_patient - first_patient)
+
+        # resume from the checkpoint
+        start_patient = first_patient
+        engine_state = None
+        if checkpoint is not None:
+            if self.streaming:
+                raise ValueError('Checkpoints are not supported when only summary statistics are kept (streaming).')
+            if trajectory_recorder is not None:
+                raise ValueError('Checkpoints are not supported when trajectories are recorded.')
+            if checkpoint.timeStepInterval is not None and not self.vectorized:
+                raise ValueError('Checkpoints within a chunk (time_step_interval) are only supported '
+                                 'by the batch engine (vectorized=True).')
+            checkpoint_key = self.__get_checkpoint_key(n_time_steps, first_patient, last_patient)
+            saved = checkpoint.load()
+            if saved is not None:
+                if str(saved['key']) != checkpoint_key:
+                    raise ValueError('Checkpoint {} was saved by a different simulation.'.format(checkpoint.fileName))
+                start_patient = int(saved['next_patient'])
+                self.cohortOutcomes.record_arrays(survival_times=saved['survival_times'],
+                                                  costs=saved['costs'],
+                                                  num_patients_alive=saved['num_patients_alive'])
+                if self.vectorized and bool(saved['if_engine']):
+                    engine_state = {name[len('engine_'):]: saved[name] for name in saved if name.startswith('engine_')}
+
+        try:
+            for n_chunks, start in enumerate(range(start_patient, last_patient, self.chunkSize), start=1):
+                end = min(start + self.chunkSize, last_patient)
+
+                # array to record the health states of patients of this chunk in
+                trajectories = None if trajectory_recorder is None \
+                    else trajectory_recorder.get_buffer(n_patients=end - start,
+                                                        initial_state=self.params.initialHealthState.value)
+
+                if self.vectorized:
+                    # simulate the patients of this chunk together
+                    engine = BatchEngine(id=self.id, pop_size=self.initialPopSize, parameters=self.params,
+                                         first_patient=start, n_patients=end - start, trajectories=trajectories,
+                                         seed=self.seed)
+                    if engine_state is not None:
+                        # continue the chunk that was being simulated when the checkpoint was saved
+                        engine.set_state(state=engine_state)
+                        engine_state = None
+
+                    on_checkpoint = None
+                    if checkpoint is not None:
+                        def on_checkpoint(start=start, engine=engine):
+                            self.__save_checkpoint(checkpoint, checkpoint_key, first_patient, start, engine)
+
+                    engine.simulate(n_time_steps=n_time_steps, sojourn_sampling=self.sojournSampling,
+                                    on_checkpoint=on_checkpoint,
+                                    checkpoint_interval=None if checkpoint is None else checkpoint.timeStepInterval)
+
+                    # store outputs of this chunk
+                    self.cohortOutcomes.record_arrays(survival_times=engine.survivalTimes,
+                                                      costs=engine.costs,
+                                                      num_patients_alive=engine.numAlive,
+                                                      first_index=start - first_patient)
+                else:
+                    # create the patients of this chunk (use id * pop_size + n as patient id)
+                    patients = [Patient(id=self.id * self.initialPopSize + i, parameters=self.params,
+                                        cohort_id=self.id, seed=self.seed)
+                                for i in range(start, end)]
+
+                    # simulate all patients
+                    for i, patient in enumerate(patients):
+                        # simulate
+                        patient.simulate(n_time_steps=n_time_steps, sojourn_sampling=self.sojournSampling,
+                                         trajectory=None if trajectories is None else trajectories[i])
+
+                    # store outputs of this chunk (patients are then discarded)
+                    self.cohortOutcomes.record_patients(simulated_patients=patients,
+                                                        first_index=start - first_patient)
+
+                # write the trajectories of this chunk to the file
+                if trajectory_recorder is not None:
+                    trajectory_recorder.append(first_index=start - first_patient, buffer=trajectories)
+
+                # save the outcomes of patients simulated so far
+                if checkpoint is not None and n_chunks % checkpoint.chunkInterval == 0 and end < last_patient:
+                    self.__save_checkpoint(checkpoint, checkpoint_key, first_patient, end, None)
+
+            # summary statistics and survival curve
+            self.cohortOutcomes.calculate_summary_stats(initial_size=last_patient - first_patient)
+        finally:
+            # keep the trajectories written so far even if the simulation fails
+            if trajectory_recorder is not None:
+                trajectory_recorder.close()
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+    def __get_checkpoint_key(self, n_time_steps, first_patient, last_patient):
+        """ :returns a description of the simulation (a checkpoint can only be resumed by the same simulation) """
+        return '{}|{}|{}|{}|{}|{}|{}|{}|{}|{}'.format(
+            self.params.get_content_hash(), self.id, self.seed, self.initialPopSize, n_time_steps,
+            first_patient, last_patient, self.chunkSize, self.vectorized, self.sojournSampling)
+
+    def __save_checkpoint(self, checkpoint, key, first_patient, next_patient, engine):
+        """ saves the outcomes of patients before next_patient and the state of the engine
+        simulating the chunk that starts with next_patient (if any) """
+        n_done = next_patient - first_patient
+        arrays = {'key': key,
+                  'next_patient': next_patient,
+                  'survival_times': self.cohortOutcomes.patientSurvivalTimes[:n_done],
+                  'costs': self.cohortOutcomes.costs[:n_done],
+                  'num_patients_alive': self.cohortOutcomes.numPatientsAlive[:n_done],
+                  'if_engine': engine is not None}
+        if engine is not None:
+            for name, array in engine.get_state().items():
+                arrays['engine_' + name] = array
+        checkpoint.save(**arrays)
+
+
+class BatchEngine:
+    """ simulates all patients of a cohort together, one time-step at a time,
+    by storing patients' health states, costs, etc. in numpy arrays """
+    def __init__(self, id, pop_size, parameters, first_patient=0, n_patients=None, trajectories=None, seed=0):
+        """
+        :param id: cohort ID
+        :param pop_size: population size of this cohort
+        :param parameters: parameters
+        :param first_patient: index of the first patient (of the cohort) to simulate
+        :param n_patients: number of patients to simulate (None to simulate to the end of the cohort)
+        :param trajectories: (optional) array of shape (n_patients, n_time_steps + 1) to record the health
+                             state of patients after each transition in (see TrajectoryRecorder.get_buffer)
+        :param seed: seed of the random number streams of patients
+        """
+        self.params = parameters
+        if n_patients is None:
+            n_patients = pop_size - first_patient
+
+        # keys of patients' random number streams (use id * pop_size + n as patient id,
+        # so each patient receives the same random numbers as in the object-per-patient engine)
+        patient_ids = id * pop_size + np.arange(first_patient, first_patient + n_patients)
+        self.rngKeys = RS.get_patient_keys(patient_ids=patient_ids, cohort_id=id, seed=seed)
+
+        # current health state of patients
+        self.states = np.full(n_patients, parameters.initialHealthState.value, dtype=np.int64)
+        # survival time of patients (nan for those still alive)
+        self.survivalTimes = np.full(n_patients, np.nan)
+        # discounted cost of patients
+        self.costs = np.zeros(n_patients)
+        # number of time-steps each patient survived
+        self.numAlive = np.zeros(n_patients, dtype=np.int32)
+        # health states of patients after each transition
+        self.trajectories = trajectories
+
+        # progress of the simulation (the counters of patients' random number streams)
+        self.timeStep = 0   # number of simulated time-steps
+        self.nJumps = 0     # number of sampled sojourns (with sojourn sampling)
+        self.patientTimeSteps = np.zeros(n_patients, dtype=np.int64)  # time-step of each patient (sojourns)
+        self.active = None  # patients still to simulate (sojourns)
+
+    def get_state(self):
+        """ :returns (dictionary) arrays that describe the progress of the simulation (see set_state) """
+        return {'states': self.states,
+                'survival_times': self.survivalTimes,
+                'costs': self.costs,
+                'num_alive': self.numAlive,
+                'time_step': self.timeStep,
+                'n_jumps': self.nJumps,
+                'patient_time_steps': self.patientTimeSteps,
+                'active': np.zeros(0, dtype=np.int64) if self.active is None else self.active,
+                'if_active': self.active is not None}
+
+    def set_state(self, state):
+        """ continues the simulation from a state returned by get_state
+        :param state: (dictionary) arrays that describe the progress of the simulation
+        """
+        self.states = np.array(state['states'], dtype=np.int64)
+        self.survivalTimes = np.array(state['survival_times'], dtype=float)
+        self.costs = np.array(state['costs'], dtype=float)
+        self.numAlive = np.array(state['num_alive'], dtype=np.int32)
+        self.timeStep = int(state['time_step'])
+        self.nJumps = int(state['n_jumps'])
+        self.patientTimeSteps = np.array(state['patient_time_steps'], dtype=np.int64)
+        self.active = np.array(state['active'], dtype=np.int64) if bool(state['if_active']) else None
+
+    def simulate(self, n_time_steps, sojourn_sampling=False, on_checkpoint=None, checkpoint_interval=None):
+        """ simulate all patients over the specified number of time-steps
+        (continues from the last simulated time-step if the simulation was resumed with set_state)
+        :param n_time_steps: number of time steps to simulate the cohort
+        :param sojourn_sampling: set to True to sample how long patients stay in each state
+                                 (instead of sampling a transition every time-step)
+        :param on_checkpoint: (optional) function called every checkpoint_interval time-steps
+                              (or sampled sojourns) to save the progress of the simulation
+        :param checkpoint_interval: number of time-steps (or sampled sojourns) between checkpoints
+        """
+        if on_checkpoint is None:
+            checkpoint_interval = None
+
+        # sojourn times are only geometric if transition probabilities do not change over time
+        if sojourn_sampling and not self.params.ifTimeVarying:
+            self.__simulate_sojourns(n_time_steps=n_time_steps, on_checkpoint=on_checkpoint,
+                                     checkpoint_interval=checkpoint_interval)
+            return
+
+        discount_factors = self.params.get_discount_factors(n_time_steps=n_time_steps)
+        # cumulative transition probabilities of each time-step (if time-varying)
+        cum_prob_tensor = self.params.get_cum_prob_tensor(n_time_steps=n_time_steps) \
+            if self.params.ifTimeVarying else None
+
+        for k in range(self.timeStep, n_time_steps):
+
+            # find patients who are still alive
+            alive = np.flatnonzero(self.states != DEATH)
+            if len(alive) == 0:
+                break
+
+            # the k-th uniform of each alive patient's stream
+            uniforms = RS.get_uniforms(keys=self.rngKeys[alive], counters=k)
+
+            # sample new states by comparing uniforms against the cumulative probabilities
+            # of the current states (returns integers from {0, 1, 2, ...})
+            current_states = self.states[alive]
+            cum_prob_matrix = self.params.cumProbMatrix if cum_prob_tensor is None else cum_prob_tensor[k]
+            new_states = (cum_prob_matrix[current_states] <= uniforms[:, np.newaxis]).sum(axis=1)
+            if_dies = new_states == DEATH
+
+            # update survival time (corrected for the half-cycle effect)
+            self.survivalTimes[alive[if_dies]] = k + 0.5
+
+            # update total discounted cost (corrected for the half-cycle effect)
+            self.costs[alive] += self.params.transitionCosts[current_states, new_states] * discount_factors[k]
+
+            # update current health states
+            self.states[alive] = new_states
+            if self.trajectories is not None:
+                self.trajectories[alive, k + 1] = new_states
+
+            # update the number of time-steps patients are alive
+            self.numAlive[alive[~if_dies]] += 1
+
+            # save the progress of the simulation
+            self.timeStep = k + 1
+            if checkpoint_interval is not None and self.timeStep % checkpoint_interval == 0 \
+                    and self.timeStep < n_time_steps:
+                on_checkpoint()
+
+    def __simulate_sojourns(self, n_time_steps, on_checkpoint, checkpoint_interval):
+        """ simulate all patients by jumping from one change of health state to the next
+        (each pass samples one sojourn for every patient who is alive and not yet at the end of simulation) """
+
+        discount_factors = self.params.get_discount_factors(n_time_steps=n_time_steps)
+        cum_discount_factors = self.params.cumDiscountFactors
+
+        # current time-step of each patient
+        time_steps = self.patientTimeSteps
+        # patients who are alive and have not reached the end of simulation
+        if self.active is None:
+            self.active = np.flatnonzero(self.states != DEATH)
+        active = self.active
+
+        n_jumps = self.nJumps  # number of sojourns sampled so far (each uses two random numbers)
+        while len(active) > 0:
+
+            states = self.states[active]
+            k = time_steps[active]
+
+            # sample the number of time-steps patients stay in their current states
+            # (geometric with the probability of staying; patients never leave absorbing states)
+            uniforms = RS.get_uniforms(keys=self.rngKeys[active], counters=2 * n_jumps)
+            log_stay_probs = self.params.logStayProbs[states]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                n_stays = np.where(log_stay_probs == 0, np.inf, np.log1p(-uniforms) / log_stay_probs)
+            n_stays = np.minimum(n_stays, n_time_steps - k).astype(np.int64)
+
+            # stay in the current states
+            self.costs[active] += self.params.transitionCosts[states, states] \
+                * (cum_discount_factors[k + n_stays] - cum_discount_factors[k])
+            self.numAlive[active] += n_stays.astype(np.int32)
+            k = k + n_stays
+
+            # patients who leave their current state before the end of simulation
+            if_leaves = k < n_time_steps
+            active, states, k = active[if_leaves], states[if_leaves], k[if_leaves]
+
+            # sample the next states from the transitions out of the current states
+            uniforms = RS.get_uniforms(keys=self.rngKeys[active], counters=2 * n_jumps + 1)
+            new_states = (self.params.exitCumProbMatrix[states] <= uniforms[:, np.newaxis]).sum(axis=1)
+            if_dies = new_states == DEATH
+
+            # update survival time (corrected for the half-cycle effect)
+            self.survivalTimes[active[if_dies]] = k[if_dies] + 0.5
+
+            # update total discounted cost (corrected for the half-cycle effect)
+            self.costs[active] += self.params.transitionCosts[states, new_states] * discount_factors[k]
+
+            # update current health states and the number of time-steps patients are alive
+            self.states[active] = new_states
+            if self.trajectories is not None:
+                self.trajectories[active, k + 1] = new_states
+            self.numAlive[active[~if_dies]] += 1
+            time_steps[active] = k + 1
+
+            # patients who are still alive and have not reached the end of simulation
+            active = active[~if_dies & (k + 1 < n_time_steps)]
+            n_jumps += 1
+
+            # save the progress of the simulation
+            self.active, self.nJumps = active, n_jumps
+            if checkpoint_interval is not None and n_jumps % checkpoint_interval == 0 and len(active) > 0:
+                on_checkpoint()
+
+
+class MultiCohort:
+    """ simulates multiple cohorts over a pool of worker processes """
+    def __init__(self, ids, pop_sizes, parameters, seed=0):
+        """
+        :param ids: (list) IDs of cohorts to simulate
+        :param pop_sizes: (list) population size of each cohort
+        :param parameters: (list) parameters of each cohort
+        :param seed: seed of the random number streams of patients of all cohorts
+        """
+        self.ids = ids
+        self.popSizes = pop_sizes
+        self.parameters = parameters
+        self.seed = seed
+        self.cohortOutcomes = []  # outcomes of simulated cohorts (in the order of ids)
+
+    def simulate(self, n_time_steps, n_workers=None, vectorized=False, cache=None):
+        """ simulate all cohorts over the specified number of time-steps
+        :param n_time_steps: number of time steps to simulate each cohort
+        :param n_workers: number of worker processes (None uses all cores, 1 simulates in this process)
+        :param vectorized: set to True to simulate each cohort with the batch engine
+        :param cache: (optional) ResultCache to load outcomes of cohorts simulated before
+                      (only cohorts not found in the cache are simulated, and their outcomes are stored)
+        """
+        n_cohorts = len(self.ids)
+
+        # outcomes of cohorts that were simulated before (both engines give the same outcomes)
+        results = [None] * n_cohorts
+        keys = [None] * n_cohorts
+        if cache is not None:
+            for i in range(n_cohorts):
+                keys[i] = cache.get_key(parameters=self.parameters[i], cohort_id=self.ids[i],
+                                        pop_size=self.popSizes[i], n_time_steps=n_time_steps, seed=self.seed)
+                results[i] = cache.get(keys[i])
+        to_simulate = [i for i in range(n_cohorts) if results[i] is None]
+
+        args = ([self.ids[i] for i in to_simulate], [self.popSizes[i] for i in to_simulate],
+                [self.parameters[i] for i in to_simulate],
+                [n_time_steps] * len(to_simulate), [vectorized] * len(to_simulate), [self.seed] * len(to_simulate))
+
+        # workers only send back arrays of patient outcomes (not the simulated patients)
+        if n_workers == 1 or len(to_simulate) <= 1:
+            simulated = list(map(_simulate_cohort, *args))
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                simulated = list(executor.map(_simulate_cohort, *args))
+
+        for i, result in zip(to_simulate, simulated):
+            results[i] = result
+            if cache is not None:
+                cache.put(keys[i], *result)
+
+        # store outputs of simulated cohorts
+        self.cohortOutcomes = []
+        for survival_times, costs, num_patients_alive in results:
+            outcomes = CohortOutcomes()
+            outcomes.record_outcomes(survival_times=survival_times,
+                                     costs=costs,
+                                     num_patients_alive=num_patients_alive)
+            self.cohortOutcomes.append(outcomes)
+
+    def get_pooled_outcomes(self):
+        """ :returns outcomes of all simulated cohorts merged into one CohortOutcomes """
+        pooled = CohortOutcomes()
+        pooled.record_outcomes(
+            survival_times=np.concatenate([o.patientSurvivalTimes for o in self.cohortOutcomes]),
+            costs=np.concatenate([o.costs for o in self.cohortOutcomes]),
+            num_patients_alive=np.concatenate([o.numPatientsAlive for o in self.cohortOutcomes]))
+        return pooled
+
+
+def _simulate_cohort(id, pop_size, parameters, n_time_steps, vectorized, seed=0):
+    """ simulates a cohort (in a worker process) and returns arrays of patient outcomes
+    (survival times with nan for survivors, discounted costs, number of time-steps alive) """
+    cohort = Cohort(id=id, pop_size=pop_size, parameters=parameters, vectorized=vectorized, seed=seed)
+    cohort.simulate(n_time_steps=n_time_steps)
+
+    outcomes = cohort.cohortOutcomes
+    return outcomes.patientSurvivalTimes, outcomes.costs, outcomes.numPatientsAlive
+
+
+class CohortTrace:
+    """ calculates the expected outcomes of a cohort exactly (no Monte Carlo) by propagating
+    the distribution of patients over health states one time-step at a time (Markov trace) """
+    def __init__(self, pop_size, parameters):
+        """
+        :param pop_size: population size of this cohort
+        :param parameters: parameters
+        """
+        self.initialPopSize = pop_size
+        self.params = parameters
+
+        self.stateProbs = None          # probability of being in each state at each time-step
+        self.nLivingPatients = None     # expected number of alive patients at each time-step
+        self.meanSurvivalTime = None    # expected survival time of patients who die
+        self.meanCost = None            # expected discounted cost
+        self.meanNumAlive = None        # expected number of time-steps patients are alive
+        self.probDeath = None           # probability of death during the simulation
+
+    def calculate(self, n_time_steps):
+        """ calculates the expected outcomes over the specified number of time-steps
+        :param n_time_steps: number of time steps to follow the cohort
+        """
+        n_states = len(P.HealthStates)
+        discount_factors = self.params.get_discount_factors(n_time_steps=n_time_steps)
+
+        # transition probability matrix (patients stay in absorbing states)
+        prob_matrix = self.params.transProbMatrix
+        if self.params.ifTimeVarying:
+            self.params.get_cum_prob_tensor(n_time_steps=n_time_steps)
 
-        # store outputs of this simulation
-        self.cohortOutcomes.extract_outcomes(simulated_patients=self.patients)
+        # all patients start from the initial health state
+        self.stateProbs = np.zeros((n_time_steps + 1, n_states))
+        self.stateProbs[0, self.params.initialHealthState.value] = 1
+
+        total_survival_time = 0
+        self.meanCost = 0
+        self.meanNumAlive = 0
+        for k in range(n_time_steps):
+
+            # transition probabilities of this time-step
+            if self.params.ifTimeVarying:
+                prob_matrix = self.params.transProbTensor[k]
+
+            # probability of each transition during this time-step (only alive patients move)
+            alive_probs = self.stateProbs[k].copy()
+            alive_probs[DEATH] = 0
+            trans_probs = alive_probs[:, np.newaxis] * prob_matrix
+
+            # probability of death during this time-step
+            prob_die = trans_probs[:, DEATH].sum()
+            total_survival_time += (k + 0.5) * prob_die  # corrected for the half-cycle effect
+
+            # expected discounted cost (corrected for the half-cycle effect)
+            self.meanCost += (trans_probs * self.params.transitionCosts).sum() * discount_factors[k]
+
+            # expected number of time-steps alive
+            self.meanNumAlive += alive_probs.sum() - prob_die
+
+            # distribution of patients over health states at the next time-step
+            self.stateProbs[k + 1] = self.stateProbs[k] @ prob_matrix
+
+        # expected number of alive patients over time
+        self.nLivingPatients = self.initialPopSize * (1 - self.stateProbs[:, DEATH])
+
+        # probability of death and expected survival time of those who die
+        self.probDeath = self.stateProbs[-1, DEATH]
+        if self.probDeath > 0:
+            self.meanSurvivalTime = total_survival_time / self.probDeath
 
 
 class CohortOutcomes:
     def __init__(self):
 
-        self.survivalTimes = []         # patients' survival times
-        self.costs = []                 # patients' discounted costs
-        # self.utilities =[]              # patients' discounted utilities
-        self.nLivingPatients = None  # survival curve (sample path of number of alive patients over time)
-        self.numPatientsAlive = []
+        self.patientSurvivalTimes = None    # survival time of each patient (nan if the patient survived)
+        self.ifDied = None                  # if each patient died (False if survival time is censored)
+        self.survivalTimes = None           # survival times of patients who died
+        self.costs = None                   # patients' discounted costs
+        # self.utilities = None             # patients' discounted utilities
+        self.numPatientsAlive = None        # number of time-steps each patient is alive
+        self.initialSize = None             # initial size of the simulated cohort
+        # survival curve (sample path of number of alive patients over time; built when first requested)
+        self._nLivingPatients = None
 
         self.statSurvivalTime = None    # summary statistics for survival time
         self.statAlive = None
@@ -179,16 +760,73 @@ class CohortOutcomes:
         """ extracts outcomes of a simulated cohort
         :param simulated_patients: a list of simulated patients"""
 
-        # record patient outcomes
-        for patient in simulated_patients:
+        self.allocate(n_patients=len(simulated_patients))
+        self.record_patients(simulated_patients=simulated_patients)
+
+        # summary statistics and survival curve
+        self.calculate_summary_stats(initial_size=len(simulated_patients))
+
+    def allocate(self, n_patients):
+        """ preallocates arrays of patient outcomes
+        :param n_patients: number of patients """
+        self.patientSurvivalTimes = np.full(n_patients, np.nan)
+        self.costs = np.zeros(n_patients)
+        self.numPatientsAlive = np.zeros(n_patients, dtype=np.int32)
+
+    def record_patients(self, simulated_patients, first_index=0):
+        """ records outcomes of simulated patients into the preallocated arrays
+        :param simulated_patients: a list of simulated patients
+        :param first_index: position of the first patient in the arrays of outcomes
+        """
+        for i, patient in enumerate(simulated_patients, start=first_index):
             # survival time
             if not (patient.stateMonitor.survivalTime is None):
-                self.survivalTimes.append(patient.stateMonitor.survivalTime)
+                self.patientSurvivalTimes[i] = patient.stateMonitor.survivalTime
 
             # discounted cost and number of patients alive
-            self.costs.append(patient.stateMonitor.costUtilityMonitor.totalDiscountedCost)
-            self.numPatientsAlive.append(patient.stateMonitor.numAlive)
-            # self.utilities.append(patient.stateMonitor.costUtilityMonitor.totalDiscountedUtility)
+            self.costs[i] = patient.stateMonitor.costUtilityMonitor.totalDiscountedCost
+            self.numPatientsAlive[i] = patient.stateMonitor.numAlive
+            # self.utilities[i] = patient.stateMonitor.costUtilityMonitor.totalDiscountedUtility
+
+    def record_arrays(self, survival_times, costs, num_patients_alive, first_index=0):
+        """ records outcomes of patients simulated with the batch engine into the preallocated arrays
+        :param survival_times: (array) survival time of each patient (nan if the patient survived)
+        :param costs: (array) discounted costs of patients
+        :param num_patients_alive: (array) number of time-steps each patient survived
+        :param first_index: position of the first patient in the arrays of outcomes
+        """
+        end = first_index + len(costs)
+        self.patientSurvivalTimes[first_index:end] = survival_times
+        self.costs[first_index:end] = costs
+        self.numPatientsAlive[first_index:end] = num_patients_alive
+
+    def record_outcomes(self, survival_times, costs, num_patients_alive):
+        """ records outcomes of a cohort simulated with the batch engine
+        :param survival_times: (array) survival time of each patient (nan if the patient survived)
+        :param costs: (array) discounted costs of all patients
+        :param num_patients_alive: (array) number of time-steps each patient survived
+        """
+        self.patientSurvivalTimes = np.asarray(survival_times, dtype=float)
+        self.costs = np.asarray(costs, dtype=float)
+        self.numPatientsAlive = np.asarray(num_patients_alive, dtype=np.int32)
+
+        # summary statistics and survival curve
+        self.calculate_summary_stats(initial_size=len(costs))
+
+    def get_restricted_survival_times(self):
+        """ :returns survival time of every patient restricted to the simulation length
+        (patients who survive are censored at the end of the simulation) """
+        # patients who die during time-step k are alive for k time-steps and have survival time k + 0.5
+        return np.where(self.ifDied, self.patientSurvivalTimes, self.numPatientsAlive)
+
+    def calculate_summary_stats(self, initial_size):
+        """ calculates summary statistics (the survival curve is built when it is first requested)
+        :param initial_size: initial size of the simulated cohort
+        """
+
+        # survival times of patients who died
+        self.ifDied = ~np.isnan(self.patientSurvivalTimes)
+        self.survivalTimes = self.patientSurvivalTimes[self.ifDied]
 
         # summary statistics
         self.statSurvivalTime = Stat.SummaryStat('Survival time', self.survivalTimes)
@@ -196,11 +834,113 @@ class CohortOutcomes:
         self.statAlive = Stat.SummaryStat('Number of patients alive', self.numPatientsAlive)
         # self.statUtility = Stat.SummaryStat('Discounted utility', self.utilities)
 
-        # survival curve
-        self.nLivingPatients = Path.PrevalencePathBatchUpdate(
-            name='# of living patients',
-            initial_size=len(simulated_patients),
-            times_of_changes=self.survivalTimes,
-            increments=[-1]*len(self.survivalTimes)
-        )
-
+        # the survival curve of these outcomes is built again when requested
+        self.initialSize = initial_size
+        self._nLivingPatients = None
+
+    @property
+    def nLivingPatients(self):
+        """ survival curve (sample path of number of alive patients over time)
+        (built only when requested, since SamplePathClasses imports matplotlib) """
+        if self._nLivingPatients is None:
+            import SimPy.SamplePathClasses as Path
+            self._nLivingPatients = Path.PrevalencePathBatchUpdate(
+                name='# of living patients',
+                initial_size=self.initialSize,
+                times_of_changes=self.survivalTimes,
+                increments=[-1]*len(self.survivalTimes)
+            )
+        return self._nLivingPatients
+
+
+
+class StreamingCohortOutcomes:
+    """ outcomes of a simulated cohort that are updated as each patient is simulated
+    (patients' outcomes are not stored, only running statistics, histograms and survival counts) """
+    def __init__(self, cost_bin_width=1000):
+        """
+        :param cost_bin_width: width of bins of the histogram of discounted costs
+        """
+        self.nPatients = 0
+        # survival curve (sample path of number of alive patients over time; built when first requested)
+        self._nLivingPatients = None
+
+        self.statSurvivalTime = OnlineStat.OnlineSummaryStat('Survival time')
+        self.statAlive = OnlineStat.OnlineSummaryStat('Number of patients alive')
+        self.statCost = OnlineStat.OnlineSummaryStat('Discounted cost')
+
+        # number of deaths during each time-step (survival times are k + 0.5)
+        self.survivalTimeHistogram = OnlineStat.OnlineHistogram(bin_width=1)
+        self.costHistogram = OnlineStat.OnlineHistogram(bin_width=cost_bin_width)
+
+    def allocate(self, n_patients):
+        """ nothing to preallocate (outcomes of patients are not stored) """
+        pass
+
+    def record_patients(self, simulated_patients, first_index=0):
+        """ adds the outcomes of simulated patients to the running statistics
+        :param simulated_patients: a list of simulated patients
+        :param first_index: (not used) position of the first patient in the cohort
+        """
+        for patient in simulated_patients:
+            self.record_patient(patient=patient)
+
+    def record_patient(self, patient):
+        """ adds the outcomes of a simulated patient to the running statistics
+        :param patient: a simulated patient """
+
+        self.nPatients += 1
+
+        # survival time
+        if not (patient.stateMonitor.survivalTime is None):
+            self.statSurvivalTime.record(patient.stateMonitor.survivalTime)
+            self.survivalTimeHistogram.record(patient.stateMonitor.survivalTime)
+
+        # discounted cost and number of patients alive
+        cost = patient.stateMonitor.costUtilityMonitor.totalDiscountedCost
+        self.statCost.record(cost)
+        self.costHistogram.record(cost)
+        self.statAlive.record(patient.stateMonitor.numAlive)
+
+    def record_arrays(self, survival_times, costs, num_patients_alive, first_index=0):
+        """ adds the outcomes of patients simulated with the batch engine to the running statistics
+        :param survival_times: (array) survival time of each patient (nan if the patient survived)
+        :param costs: (array) discounted costs of patients
+        :param num_patients_alive: (array) number of time-steps each patient survived
+        :param first_index: (not used) position of the first patient in the cohort
+        """
+        self.nPatients += len(costs)
+
+        # survival times of patients who died
+        survival_times = survival_times[~np.isnan(survival_times)]
+        self.statSurvivalTime.record_batch(survival_times)
+        self.survivalTimeHistogram.record_batch(survival_times)
+
+        # discounted cost and number of patients alive
+        self.statCost.record_batch(costs)
+        self.costHistogram.record_batch(costs)
+        self.statAlive.record_batch(num_patients_alive)
+
+    def calculate_summary_stats(self, initial_size=None):
+        """ marks the survival curve to be built again from the number of deaths during each time-step
+        (it is built when it is first requested)
+        :param initial_size: (not used) initial size of the simulated cohort
+        """
+        self._nLivingPatients = None
+
+    @property
+    def nLivingPatients(self):
+        """ survival curve (sample path of number of alive patients over time)
+        (built only when requested, since SamplePathClasses imports matplotlib) """
+        if self._nLivingPatients is None:
+            n_deaths = self.survivalTimeHistogram.get_counts()
+            time_steps = np.flatnonzero(n_deaths)
+
+            import SimPy.SamplePathClasses as Path
+            self._nLivingPatients = Path.PrevalencePathBatchUpdate(
+                name='# of living patients',
+                initial_size=self.nPatients,
+                times_of_changes=(time_steps + 0.5).tolist(),
+                increments=(-n_deaths[time_steps]).tolist()
+            )
+        return self._nLivingPatients
@@ -0,0 +1,178 @@
+import numpy as np
+import scipy.stats as stat
+
+
+class OnlineSummaryStat:
+    """ summary statistics of observations that are updated as observations arrive
+    (Welford's algorithm), so the observations themselves do not need to be stored """
+    def __init__(self, name):
+        """
+        :param name: name of this statistic
+        """
+        self.name = name
+        self._n = 0             # number of observations
+        self._mean = 0          # running mean
+        self._m2 = 0            # running sum of squared deviations from the mean
+        self._min = np.inf
+        self._max = -np.inf
+
+    def record(self, obs):
+        """ updates the statistics with a new observation
+        :param obs: the new observation
+        """
+        self._n += 1
+        delta = obs - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (obs - self._mean)
+        self._min = min(self._min, obs)
+        self._max = max(self._max, obs)
+
+    def record_batch(self, obs):
+        """ updates the statistics with an array of new observations
+        (merges the statistics of the batch with the running statistics; Chan et al.)
+        :param obs: (array) new observations
+        """
+        obs = np.asarray(obs, dtype=float)
+        n_batch = len(obs)
+        if n_batch == 0:
+            return
+
+        mean_batch = obs.mean()
+        m2_batch = ((obs - mean_batch) ** 2).sum()
+
+        n = self._n + n_batch
+        delta = mean_batch - self._mean
+        self._mean += delta * n_batch / n
+        self._m2 += m2_batch + delta ** 2 * self._n * n_batch / n
+        self._n = n
+        self._min = min(self._min, obs.min())
+        self._max = max(self._max, obs.max())
+
+    def merge(self, other):
+        """ merges the statistics of another OnlineSummaryStat into this one
+        :param other: an OnlineSummaryStat
+        """
+        if other._n == 0:
+            return
+        n = self._n + other._n
+        delta = other._mean - self._mean
+        self._mean += delta * other._n / n
+        self._m2 += other._m2 + delta ** 2 * self._n * other._n / n
+        self._n = n
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    def get_n(self):
+        return self._n
+
+    def get_mean(self):
+        return self._mean if self._n > 0 else np.nan
+
+    def get_variance(self):
+        return self._m2 / (self._n - 1) if self._n > 1 else np.nan
+
+    def get_stdev(self):
+        return np.sqrt(self.get_variance())
+
+    def get_min(self):
+        return self._min
+
+    def get_max(self):
+        return self._max
+
+    def get_t_half_length(self, alpha):
+        """ :returns half-length of the t-based confidence interval of the mean
+        :param alpha: significance level """
+        if self._n < 2:
+            return np.nan
+        return stat.t.ppf(1 - alpha / 2, self._n - 1) * self.get_stdev() / np.sqrt(self._n)
+
+    def get_t_CI(self, alpha):
+        """ :returns t-based confidence interval of the mean
+        :param alpha: significance level """
+        half_length = self.get_t_half_length(alpha)
+        return [self._mean - half_length, self._mean + half_length]
+
+    def get_interval(self, interval_type, alpha):
+        """ :returns the confidence interval of the mean
+        :param interval_type: 'c' for t-based confidence interval (the only interval available
+                              without storing observations)
+        :param alpha: significance level """
+        if interval_type != 'c':
+            raise ValueError('Only confidence intervals (interval_type=\'c\') are available for online statistics.')
+        return self.get_t_CI(alpha)
+
+    def get_formatted_mean_and_interval(self, interval_type, alpha, deci=0, form=None):
+        """ :returns (string) the mean and interval formatted as 'mean (lower, upper)'
+        :param interval_type: 'c' for t-based confidence interval
+        :param alpha: significance level
+        :param deci: number of digits to round the numbers to
+        :param form: ',' to format numbers with thousands separators
+        """
+        interval = self.get_interval(interval_type=interval_type, alpha=alpha)
+        text = '{:' + (form if form is not None else '') + '.' + str(deci) + 'f}'
+        return (text + ' (' + text + ', ' + text + ')').format(self.get_mean(), interval[0], interval[1])
+
+
+class OnlineHistogram:
+    """ counts of observations in bins of a fixed width (more bins are added as needed) """
+    def __init__(self, bin_width, min_value=0):
+        """
+        :param bin_width: width of bins
+        :param min_value: lower edge of the first bin
+        """
+        self.binWidth = bin_width
+        self.minValue = min_value
+        self.counts = np.zeros(16, dtype=np.int64)
+        self.nBins = 0  # number of bins used so far
+
+    def record(self, obs):
+        """ adds an observation to its bin
+        :param obs: the new observation
+        """
+        i = self.__find_bin(obs)
+        self.__add_bins(i + 1)
+        self.counts[i] += 1
+
+    def record_batch(self, obs):
+        """ adds an array of observations to their bins
+        :param obs: (array) new observations
+        """
+        obs = np.asarray(obs, dtype=float)
+        if len(obs) == 0:
+            return
+        bins = self.__find_bin(obs)
+        n_bins = bins.max() + 1
+        self.__add_bins(n_bins)
+        self.counts[:n_bins] += np.bincount(bins, minlength=n_bins)
+
+    def merge(self, other):
+        """ adds the counts of another OnlineHistogram with the same bins to this one
+        :param other: an OnlineHistogram
+        """
+        if other.binWidth != self.binWidth or other.minValue != self.minValue:
+            raise ValueError('Histograms with different bins cannot be merged.')
+        self.__add_bins(other.nBins)
+        self.counts[:other.nBins] += other.counts[:other.nBins]
+
+    def get_counts(self):
+        """ :returns counts of observations in each bin """
+        return self.counts[:self.nBins]
+
+    def get_bin_edges(self):
+        """ :returns edges of bins (one more than the number of bins) """
+        return self.minValue + self.binWidth * np.arange(self.nBins + 1)
+
+    def __find_bin(self, obs):
+        bins = np.floor_divide(np.subtract(obs, self.minValue), self.binWidth).astype(int)
+        if np.any(bins < 0):
+            raise ValueError('Observations should not be smaller than the lower edge of the first bin.')
+        return bins
+
+    def __add_bins(self, n_bins):
+        """ makes sure that the histogram has at least n_bins bins """
+        if n_bins > len(self.counts):
+            counts = np.zeros(max(n_bins, 2 * len(self.counts)), dtype=np.int64)
+            counts[:self.nBins] = self.counts[:self.nBins]
+            self.counts = counts
+        self.nBins = max(self.nBins, n_bins)
@@ -0,0 +1,120 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ParameterClasses as P
+import MarkovModelClasses as Cls
+import SimPy.StatisticalClasses as Stat
+
+
+class PSA:
+    """ probabilistic sensitivity analysis: for each sampled parameter set, simulates one cohort
+    per therapy and collects the mean cost and effect of the cohort """
+    def __init__(self, n_iterations, pop_size, therapies=None, time_varying=False):
+        """
+        :param n_iterations: number of parameter sets to sample
+        :param pop_size: population size of each simulated cohort
+        :param therapies: (list) therapies to evaluate (all therapies if None)
+        :param time_varying: set to True to use time-varying transition probabilities
+        """
+        self.nIterations = n_iterations
+        self.popSize = pop_size
+        self.therapies = list(P.Therapies) if therapies is None else therapies
+        self.timeVarying = time_varying
+
+        # mean outcomes of simulated cohorts (rows: therapies, columns: PSA iterations)
+        shape = (len(self.therapies), n_iterations)
+        self.meanCosts = np.full(shape, np.nan)
+        self.meanEffects = np.full(shape, np.nan)       # mean number of time-steps patients are alive
+        self.meanSurvivalTimes = np.full(shape, np.nan)
+
+    def simulate(self, n_time_steps, n_workers=None, chunk_size=10, vectorized=True,
+                 csv_file_name=None, callback=None):
+        """ simulates cohorts for all PSA iterations
+        :param n_time_steps: number of time steps to simulate each cohort
+        :param n_workers: number of worker processes (None uses all cores, 1 simulates in this process)
+        :param chunk_size: number of iterations sent to a worker at once
+        :param vectorized: set to True to simulate cohorts with the batch engine
+        :param csv_file_name: (optional) csv file to write the results of each iteration to as they arrive
+        :param callback: (optional) function called with (iteration, costs, effects) as results arrive
+        """
+        n = self.nIterations
+        args = (range(n), [self.popSize] * n, [self.therapies] * n,
+                [n_time_steps] * n, [vectorized] * n, [self.timeVarying] * n)
+
+        csv_file = None
+        writer = None
+        if csv_file_name is not None:
+            csv_file = open(csv_file_name, 'w', newline='')
+            writer = csv.writer(csv_file)
+            writer.writerow(['Iteration', 'Therapy', 'Mean cost', 'Mean effect', 'Mean survival time'])
+
+        try:
+            if n_workers == 1:
+                self.__collect(results=map(_simulate_iteration, *args), writer=writer, callback=callback)
+            else:
+                with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                    self.__collect(results=executor.map(_simulate_iteration, *args, chunksize=chunk_size),
+                                   writer=writer, callback=callback)
+        finally:
+            if csv_file is not None:
+                csv_file.close()
+
+    def __collect(self, results, writer, callback):
+        """ stores the results of PSA iterations as they arrive """
+        for i, costs, effects, survival_times in results:
+            self.meanCosts[:, i] = costs
+            self.meanEffects[:, i] = effects
+            self.meanSurvivalTimes[:, i] = survival_times
+
+            if writer is not None:
+                for t, therapy in enumerate(self.therapies):
+                    writer.writerow([i, therapy.name, costs[t], effects[t], survival_times[t]])
+            if callback is not None:
+                callback(i, costs, effects)
+
+    def get_strategies(self, names, colors):
+        """ :returns (list) Econ.Strategy for each therapy from the mean costs and effects of PSA iterations
+        :param names: (list) names of therapies
+        :param colors: (list) colors of therapies
+        """
+        import SimPy.EconEvalClasses as Econ
+
+        strategies = []
+        for t in range(len(self.therapies)):
+            strategies.append(Econ.Strategy(name=names[t],
+                                            cost_obs=self.meanCosts[t],
+                                            effect_obs=self.meanEffects[t],
+                                            color=colors[t]))
+        return strategies
+
+    def get_stat_mean_cost(self, therapy_index):
+        """ :returns summary statistics of the mean cost of the specified therapy over PSA iterations """
+        return Stat.SummaryStat('Mean discounted cost', self.meanCosts[therapy_index])
+
+    def get_stat_mean_effect(self, therapy_index):
+        """ :returns summary statistics of the mean effect of the specified therapy over PSA iterations """
+        return Stat.SummaryStat('Mean number of patients alive', self.meanEffects[therapy_index])
+
+
+def _simulate_iteration(iteration, pop_size, therapies, n_time_steps, vectorized, time_varying=False):
+    """ samples a parameter set and simulates a cohort for each therapy (in a worker process)
+    :returns (iteration, mean costs, mean effects, mean survival times) where each is a list over therapies """
+    costs = []
+    effects = []
+    survival_times = []
+    for therapy in therapies:
+        # the iteration is used as the seed of parameters and as the cohort id,
+        # so all therapies are evaluated with the same parameter values and random numbers
+        cohort = Cls.Cohort(id=iteration,
+                            pop_size=pop_size,
+                            parameters=P.ParametersProbabilistic(therapy=therapy, seed=iteration,
+                                                                 time_varying=time_varying),
+                            vectorized=vectorized)
+        cohort.simulate(n_time_steps=n_time_steps)
+
+        outcomes = cohort.cohortOutcomes
+        costs.append(np.mean(outcomes.costs))
+        effects.append(np.mean(outcomes.numPatientsAlive))
+        survival_times.append(np.mean(outcomes.survivalTimes) if len(outcomes.survivalTimes) > 0 else np.nan)
+
+    return iteration, costs, effects, survival_times
@@ -1,6 +1,8 @@
 from enum import Enum
+import hashlib
 import numpy as np
 import InputData as Data
+import SimPy.RandomVariantGenerators as RVGs
 
 
 class HealthStates(Enum):
@@ -22,7 +24,16 @@ class Therapies(Enum):
 
 
 class ParametersFixed:
-    def __init__(self, therapy):
+    def __init__(self, therapy, inputs=None, time_varying=False):
+        """
+        :param therapy: selected therapy
+        :param inputs: (optional) inputs of a scenario (ScenarioLoader.ModelInputs);
+                       inputs defined in InputData are used if not provided
+        :param time_varying: set to True to add background mortality that rises with age and
+                             a therapy effect that wears off over time to transition probabilities
+        """
+        if inputs is None:
+            inputs = Data
 
         # selected therapy
         self.therapy = therapy
@@ -32,9 +43,9 @@ class ParametersFixed:
 
         # annual treatment cost
         if self.therapy == Therapies.AMINOSALICYLATE:
-            self.annualTreatmentCost = Data.Aminosalicylate_COST
+            self.annualTreatmentCost = inputs.Aminosalicylate_COST
         else:
-            self.annualTreatmentCost = Data.Aminosalicylate_COST + Data.Immunosuppresive_COST
+            self.annualTreatmentCost = inputs.Aminosalicylate_COST + inputs.Immunosuppresive_COST
 
         # transition probability matrix of the selected therapy
         self.probMatrix = []
@@ -42,17 +53,254 @@ class ParametersFixed:
         # calculate transition probabilities between treatment states
         if self.therapy == Therapies.AMINOSALICYLATE:
             # calculate transition probability matrix for the amino therapy
-            self.probMatrix = Data.TRANS_MATRIX
+            self.probMatrix = inputs.TRANS_MATRIX
 
         else:
-            self.probMatrix = Data.TRANS_MATRIX
+            self.probMatrix = inputs.TRANS_MATRIX
 
         # annual state costs and utilities
-        self.annualStateCosts = Data.ANNUAL_STATE_COST
+        self.annualStateCosts = inputs.ANNUAL_STATE_COST
         # self.annualStateUtilities = Data.ANNUAL_STATE_UTILITY
 
         # discount rate
-        self.discountRate = Data.DISCOUNT
+        self.discountRate = inputs.DISCOUNT
+
+        # time-varying transition probabilities
+        self.ifTimeVarying = time_varying
+        # annual probability of background mortality at the start of simulation and its growth with age
+        self.annualProbBackgroundMort = Data.ANNUAL_PROB_BACKGROUND_MORT
+        self.backgroundMortGrowth = Data.BACKGROUND_MORT_AGE_GROWTH
+        # transition probabilities once the effect of immunosuppresive therapy has worn off
+        # (those of aminosalicylate therapy) and the half-life of the effect
+        self.wanedProbMatrix = inputs.TRANS_MATRIX
+        self.therapyEffectHalfLife = None if self.therapy == Therapies.AMINOSALICYLATE \
+            else Data.THERAPY_EFFECT_HALF_LIFE
+
+        # samplers of the next health state (one per row of the transition probability matrix)
+        self.transitionSamplers = []
+        # cumulative transition probabilities (used by the batch engine)
+        self.cumProbMatrix = None
+        # transition probabilities (patients stay in absorbing states)
+        self.transProbMatrix = None
+        # for sampling how long patients stay in each state (sojourn time) and the state they move to next
+        self.logStayProbs = None
+        self.exitSamplers = []
+        self.exitCumProbMatrix = None
+        # cost of each transition between health states (corrected for the half-cycle effect)
+        self.transitionCosts = None
+        # discount factor of each time-step (corrected for the half-cycle effect)
+        self.discountFactors = None
+        # sums of discount factors of time-steps before each time-step (0, 1, ..., n_time_steps)
+        self.cumDiscountFactors = None
+        # cumulative and non-cumulative transition probabilities of each time-step (time-varying only)
+        self.cumProbTensor = None
+        self.transProbTensor = None
+
+        # build the samplers once so that they are shared by all patients
+        self.build_lookup_tables()
+
+    def build_lookup_tables(self):
+        """ builds the samplers and tables that are calculated from the parameter values
+        (should be called again if parameter values are changed) """
+
+        self.transitionSamplers = []
+        for s, row in enumerate(self.probMatrix):
+            self.transitionSamplers.append(TransitionSampler(probabilities=row, state_index=s))
+
+        self.cumProbMatrix = np.array([sampler.cumProbs for sampler in self.transitionSamplers])
+        self.transProbMatrix = np.diff(self.cumProbMatrix, axis=1, prepend=0)
+
+        # the number of time-steps a patient stays in a state is geometric with the probability
+        # of staying (the diagonal), and the next state is sampled from the off-diagonal probabilities
+        with np.errstate(divide='ignore'):
+            self.logStayProbs = np.log(np.diag(self.transProbMatrix))  # 0 for absorbing states
+        self.exitSamplers = []
+        for s, row in enumerate(self.transProbMatrix):
+            exit_probs = row.copy()
+            exit_probs[s] = 0
+            if exit_probs.sum() > 0:
+                exit_probs /= exit_probs.sum()
+            self.exitSamplers.append(TransitionSampler(probabilities=exit_probs, state_index=s))
+        self.exitCumProbMatrix = np.array([sampler.cumProbs for sampler in self.exitSamplers])
+
+        # cost of transitions from each state (rows) to each state (columns):
+        # average of the annual costs of the two states plus the cost of treatment
+        # (if Chron's death will occur, add the cost for half-year of treatment)
+        state_costs = np.array(self.annualStateCosts, dtype=float)
+        treatment_costs = np.full(len(state_costs), 1 * self.annualTreatmentCost, dtype=float)
+        treatment_costs[HealthStates.DEATH.value] = 0.5 * self.annualTreatmentCost
+        self.transitionCosts = 0.5 * (state_costs[:, np.newaxis] + state_costs[np.newaxis, :]) \
+            + treatment_costs[np.newaxis, :]
+
+        # discount factors over the default simulation length
+        self.discountFactors = np.zeros(0)
+        self.get_discount_factors(n_time_steps=Data.SIM_LENGTH)
+
+        # these tables are shared by all patients (and the batch engine) and should not be modified
+        for table in (self.cumProbMatrix, self.transProbMatrix, self.logStayProbs,
+                      self.exitCumProbMatrix, self.transitionCosts):
+            table.setflags(write=False)
+
+        # transition probabilities of time-steps over the default simulation length
+        self.cumProbTensor = None
+        self.transProbTensor = None
+        if self.ifTimeVarying:
+            self.get_cum_prob_tensor(n_time_steps=Data.SIM_LENGTH)
+
+    def get_discount_factors(self, n_time_steps):
+        """ :returns discount factors of time-steps 0, 1, ..., n_time_steps - 1 (the present value of
+        a payment of 1 made in the middle of each time-step, i.e. corrected for the half-cycle effect)
+        :param n_time_steps: number of time-steps (the table is extended if it is shorter than this)
+        """
+        if len(self.discountFactors) < n_time_steps:
+            # present value of a payment of 1 discounted over 2k+1 half-cycles
+            # (the closed form of EconEvalClasses.pv_single_payment, so that EconEvalClasses is not imported)
+            self.discountFactors = np.array(
+                [(1 + self.discountRate / 2) ** -(2 * k + 1) for k in range(n_time_steps)])
+            self.cumDiscountFactors = np.concatenate(([0], np.cumsum(self.discountFactors)))
+            self.discountFactors.setflags(write=False)
+            self.cumDiscountFactors.setflags(write=False)
+
+        return self.discountFactors
+
+    def get_cum_prob_tensor(self, n_time_steps):
+        """ :returns (array of shape (n_time_steps, states, states)) cumulative transition probabilities
+        of time-steps 0, 1, ..., n_time_steps - 1 when transition probabilities are time-varying
+        (calculated once and shared by all patients; the table is extended if it is shorter than this)
+        :param n_time_steps: number of time-steps
+        """
+        if self.cumProbTensor is None or len(self.cumProbTensor) < n_time_steps:
+            k = np.arange(n_time_steps)
+
+            # the effect of therapy wears off: probabilities move towards those without the effect
+            waned_probs = np.diff(np.array([TransitionSampler(probabilities=row, state_index=s).cumProbs
+                                            for s, row in enumerate(self.wanedProbMatrix)]), axis=1, prepend=0)
+            if self.therapyEffectHalfLife is None:
+                effect = np.ones(n_time_steps)
+            else:
+                effect = 0.5 ** (k / self.therapyEffectHalfLife)
+            probs = effect[:, np.newaxis, np.newaxis] * self.transProbMatrix[np.newaxis] \
+                + (1 - effect)[:, np.newaxis, np.newaxis] * waned_probs[np.newaxis]
+
+            # background mortality (the hazard grows exponentially with age)
+            hazards = -np.log(1 - self.annualProbBackgroundMort) * np.exp(self.backgroundMortGrowth * k)
+            probs_background_mort = 1 - np.exp(-hazards)
+            alive = np.arange(len(HealthStates)) != HealthStates.DEATH.value
+            probs[:, alive, :] *= (1 - probs_background_mort)[:, np.newaxis, np.newaxis]
+            probs[:, alive, HealthStates.DEATH.value] += probs_background_mort[:, np.newaxis]
+
+            self.cumProbTensor = np.cumsum(probs, axis=2)
+            self.cumProbTensor /= self.cumProbTensor[:, :, -1:]
+            self.transProbTensor = np.diff(self.cumProbTensor, axis=2, prepend=0)
+            self.cumProbTensor.setflags(write=False)
+            self.transProbTensor.setflags(write=False)
+
+        return self.cumProbTensor
+
+    def get_content_hash(self):
+        """ :returns a hash of the parameter values that affect simulation outcomes
+        (parameters with the same values have the same hash, e.g. to find previously simulated results) """
+        hash_obj = hashlib.sha256()
+        values_to_hash = [self.probMatrix, self.annualStateCosts,
+                          [self.annualTreatmentCost, self.discountRate, self.initialHealthState.value]]
+        if self.ifTimeVarying:
+            values_to_hash += [self.wanedProbMatrix,
+                               [self.annualProbBackgroundMort, self.backgroundMortGrowth,
+                                np.nan if self.therapyEffectHalfLife is None else self.therapyEffectHalfLife]]
+        for values in values_to_hash:
+            array = np.ascontiguousarray(values, dtype=float)
+            hash_obj.update(str(array.shape).encode())
+            hash_obj.update(array.tobytes())
+        return hash_obj.hexdigest()
+
+
+class ParametersProbabilistic(ParametersFixed):
+    """ parameters sampled from their probability distributions (for probabilistic sensitivity analysis) """
+    def __init__(self, therapy, seed, inputs=None, time_varying=False):
+        """
+        :param therapy: selected therapy
+        :param seed: seed of the random number generator used to sample this parameter set
+                     (the same seed gives the same transition matrix and costs for all therapies)
+        :param inputs: (optional) inputs of a scenario (ScenarioLoader.ModelInputs) whose values
+                       are used as the means of distributions; inputs defined in InputData if not provided
+        :param time_varying: set to True to use time-varying transition probabilities
+        """
+        ParametersFixed.__init__(self, therapy=therapy, inputs=inputs, time_varying=time_varying)
+        if inputs is None:
+            inputs = Data
+
+        rng = RVGs.RNG(seed=seed)
+
+        # transition probabilities (a Dirichlet distribution for each row)
+        self.probMatrix = []
+        for row in inputs.TRANS_MATRIX:
+            row = np.array(row, dtype=float)
+            # impossible transitions (probability 0) stay impossible
+            if_possible = row > 0
+            if np.count_nonzero(if_possible) <= 1:
+                # absorbing state or a state with a single possible transition (nothing to sample)
+                self.probMatrix.append(row)
+            else:
+                sampled_row = np.zeros(len(row))
+                sampled_row[if_possible] = rng.dirichlet(alpha=row[if_possible] * Data.TRANS_MATRIX_SAMPLE_SIZE)
+                self.probMatrix.append(sampled_row)
+        # the sampled transition probabilities are also those once the effect of therapy has worn off
+        self.wanedProbMatrix = self.probMatrix
+
+        # annual state costs (gamma distributions)
+        self.annualStateCosts = [sample_gamma(rng=rng, mean=cost, cv=Data.STATE_COST_CV)
+                                 for cost in inputs.ANNUAL_STATE_COST]
+
+        # annual therapy costs (gamma distributions)
+        # both costs are always sampled so that all therapies receive the same parameter values
+        amino_cost = sample_gamma(rng=rng, mean=inputs.Aminosalicylate_COST, cv=Data.THERAPY_COST_CV)
+        immuno_cost = sample_gamma(rng=rng, mean=inputs.Immunosuppresive_COST, cv=Data.THERAPY_COST_CV)
+        if self.therapy == Therapies.AMINOSALICYLATE:
+            self.annualTreatmentCost = amino_cost
+        else:
+            self.annualTreatmentCost = amino_cost + immuno_cost
+
+        # rebuild samplers for the sampled parameter values
+        self.build_lookup_tables()
+
+
+def sample_gamma(rng, mean, cv):
+    """ samples from a gamma distribution with the specified mean and coefficient of variation
+    :param rng: random number generator
+    :param mean: mean of the gamma distribution (returns 0 if the mean is 0)
+    :param cv: coefficient of variation (st_dev / mean)
+    """
+    if mean == 0:
+        return 0
+    # method of moments: shape = 1/cv^2, scale = mean * cv^2
+    return rng.gamma(shape=1 / cv ** 2, scale=mean * cv ** 2)
+
+
+class TransitionSampler:
+    """ samples the next health state from a row of the transition probability matrix
+    (cumulative probabilities are calculated only once instead of every time a patient moves) """
+    __slots__ = ('cumProbs',)
+
+    def __init__(self, probabilities, state_index):
+        """
+        :param probabilities: (list) transition probabilities from this state to all states
+        :param state_index: index of this state (patients stay in absorbing states,
+                            which have a row of all zeros in the transition matrix)
+        """
+        probs = np.array(probabilities, dtype=float)
+        if probs.sum() == 0:
+            probs[state_index] = 1
+        elif abs(probs.sum() - 1) > 0.00001:
+            raise ValueError('Transition probabilities out of state {} should sum to 1.'.format(state_index))
+
+        self.cumProbs = np.cumsum(probs)
+        self.cumProbs /= self.cumProbs[-1]
+        self.cumProbs.setflags(write=False)
+
+    def sample(self, uniform):
+        """ :param uniform: a uniform random number in [0, 1)
+        :returns the index of the next state """
+        return int(self.cumProbs.searchsorted(uniform, side='right'))
 
 
 # do i even need these matrices??
@@ -0,0 +1,226 @@
+""" opt-in profiling of the simulation
+
+while a Profiler is enabled, the methods on the hot path of the object-per-patient engine are
+replaced by wrappers that count calls and measure their cumulative wall time; the transitions
+between health states (including time-steps spent in the same state) are also counted, but only for
+the object-per-patient engine (the batch engine is timed as a whole). the original methods are
+restored when the profiler is disabled, so the simulation runs without any overhead when profiling
+is not requested. (methods are only wrapped in this process: simulate cohorts with n_workers=1 to
+profile them)
+the peak memory of a phase is measured in a separate run (see measure_memory), since tracing memory
+slows down the code and would inflate the measured times.
+
+usage:
+    python Profiler.py --pop-size 10000 --sim-length 10 --output profile [--memory]
+    (writes profile.json with the summary and profile.pstats with the cProfile statistics)
+"""
+import argparse
+import cProfile
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+import numpy as np
+import InputData as D
+import ParameterClasses as P
+import MarkovModelClasses as Cls
+
+# (class, name of method) of methods to instrument
+TARGETS = [
+    (Cls.Patient, 'simulate'),
+    (Cls.PatientStateMonitor, 'update'),
+    (Cls.PatientStateMonitor, 'stay'),
+    (Cls.PatientCostUtilityMonitor, 'update'),
+    (Cls.CohortOutcomes, 'extract_outcomes'),
+    (Cls.CohortOutcomes, 'record_patients'),
+    (Cls.BatchEngine, 'simulate'),
+]
+
+
+class Profiler:
+    def __init__(self, targets=None):
+        """
+        :param targets: (list) (class, name of method) of methods to instrument (TARGETS if None)
+        """
+        self.targets = TARGETS if targets is None else targets
+
+        self.callCounts = {}    # number of calls of each method
+        self.callTimes = {}     # cumulative wall time (seconds) of each method
+        # number of transitions from each health state (rows) to each health state (columns)
+        # of patients simulated with the object-per-patient engine
+        n_states = len(P.HealthStates)
+        self.transitionCounts = np.zeros((n_states, n_states), dtype=np.int64)
+        self.phases = []        # (name, seconds, peak bytes) of each phase
+
+        self._originals = {}    # original methods replaced by wrappers
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def enable(self):
+        """ replaces the target methods by instrumented wrappers """
+        if self._originals:
+            return
+        for cls, name in self.targets:
+            method = cls.__dict__[name]
+            self._originals[(cls, name)] = method
+            if cls is Cls.PatientStateMonitor and name == 'update':
+                wrapper = self.__wrap_state_update(method)
+            elif cls is Cls.PatientStateMonitor and name == 'stay':
+                wrapper = self.__wrap_state_stay(method)
+            else:
+                wrapper = self.__wrap(method, '{}.{}'.format(cls.__name__, name))
+            setattr(cls, name, wrapper)
+
+    def disable(self):
+        """ restores the original methods """
+        for (cls, name), method in self._originals.items():
+            setattr(cls, name, method)
+        self._originals = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ measures the wall time of a phase of the analysis
+        (use as 'with profiler.phase('simulate'): ...'; see measure_memory for its peak memory) """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, None))
+
+    def measure_memory(self, name, function):
+        """ runs a phase again under tracemalloc (with the methods not instrumented) to measure its
+        peak memory, in a separate run from the timed one since tracing memory slows down the code
+        :param name: name of the phase (the peak memory is recorded with the timed phase of this name)
+        :param function: function (with no arguments) that runs the phase
+        :returns the value returned by the function
+        """
+        tracemalloc.start()
+        try:
+            value = function()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.phases = [(phase, seconds, peak_bytes if phase == name else phase_peak_bytes)
+                       for phase, seconds, phase_peak_bytes in self.phases]
+        return value
+
+    def run(self, function, stats_file_name=None):
+        """ runs a function under cProfile (with the methods instrumented)
+        :param function: function (with no arguments) to run
+        :param stats_file_name: (optional) file to write the cProfile statistics to (readable with pstats)
+        :returns the value returned by the function
+        """
+        profile = cProfile.Profile()
+        with self:
+            value = profile.runcall(function)
+        if stats_file_name is not None:
+            profile.dump_stats(stats_file_name)
+        return value
+
+    def get_summary(self):
+        """ :returns (dictionary) call counts and times of methods, transition counts and phases
+        (transitions are counted only for cohorts simulated with the object-per-patient engine;
+        they are not counted in the batch engine, so they are empty for vectorized cohorts) """
+        return {
+            'methods': {name: {'calls': self.callCounts[name], 'seconds': self.callTimes[name]}
+                        for name in self.callCounts},
+            'transitions': {'{}->{}'.format(P.HealthStates(i).name, P.HealthStates(j).name): int(count)
+                            for (i, j), count in np.ndenumerate(self.transitionCounts) if count > 0},
+            'phases': [{'phase': name, 'seconds': seconds, 'peak_bytes': peak_bytes}
+                       for name, seconds, peak_bytes in self.phases]
+        }
+
+    def print_summary(self):
+        """ prints the call counts and times of methods (slowest first) and phases """
+        for name in sorted(self.callTimes, key=self.callTimes.get, reverse=True):
+            calls = self.callCounts[name]
+            if calls == 0:
+                continue
+            print('{:<40} {:>10} calls {:10.4f}s {:10.2f}us/call'.format(
+                name, calls, self.callTimes[name], 1e6 * self.callTimes[name] / calls))
+        for name, seconds, peak_bytes in self.phases:
+            print('{:<40} {:>16} {:10.4f}s'.format(name, 'phase', seconds)
+                  + ('' if peak_bytes is None else '  {:10.1f}MB'.format(peak_bytes / 1e6)))
+
+    def write_summary(self, file_name):
+        """ writes the summary to a json file """
+        with open(file_name, 'w') as file:
+            json.dump(self.get_summary(), file, indent=1)
+
+    def __wrap(self, method, name):
+        """ :returns a wrapper of the method that counts calls and measures their wall time """
+        self.callCounts.setdefault(name, 0)
+        self.callTimes.setdefault(name, 0)
+        counts, times = self.callCounts, self.callTimes
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[name] += time.perf_counter() - start
+                counts[name] += 1
+        return wrapper
+
+    def __wrap_state_update(self, method):
+        """ :returns a wrapper of PatientStateMonitor.update that also counts transitions """
+        timed = self.__wrap(method, 'PatientStateMonitor.update')
+        transition_counts = self.transitionCounts
+
+        @functools.wraps(method)
+        def wrapper(monitor, time_step, new_state, parameters):
+            transition_counts[monitor.currentState, new_state] += 1
+            return timed(monitor, time_step, new_state, parameters)
+        return wrapper
+
+    def __wrap_state_stay(self, method):
+        """ :returns a wrapper of PatientStateMonitor.stay that also counts the time-steps spent
+        in the same state (as transitions from a state to itself) """
+        timed = self.__wrap(method, 'PatientStateMonitor.stay')
+        transition_counts = self.transitionCounts
+
+        @functools.wraps(method)
+        def wrapper(monitor, time_step, n_time_steps, parameters):
+            # the monitor does nothing for patients who have died
+            if monitor.currentState != Cls.DEATH:
+                transition_counts[monitor.currentState, monitor.currentState] += n_time_steps
+            return timed(monitor, time_step, n_time_steps, parameters)
+        return wrapper
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Profiles the simulation of a cohort.')
+    parser.add_argument('--pop-size', type=int, default=D.POP_SIZE)
+    parser.add_argument('--sim-length', type=int, default=D.SIM_LENGTH)
+    parser.add_argument('--therapy', choices=[t.name for t in P.Therapies], default=P.Therapies.AMINOSALICYLATE.name)
+    parser.add_argument('--vectorized', action='store_true', help='simulate with the batch engine')
+    parser.add_argument('--memory', action='store_true',
+                        help='simulate the cohort again to measure its peak memory (not timed)')
+    parser.add_argument('--output', default='profile', help='prefix of the summary (.json) and cProfile (.pstats) files')
+    args = parser.parse_args()
+
+    profiler = Profiler()
+    params = P.ParametersFixed(therapy=P.Therapies[args.therapy])
+    cohort = Cls.Cohort(id=0, pop_size=args.pop_size, parameters=params, vectorized=args.vectorized)
+
+    def simulate():
+        cohort.simulate(n_time_steps=args.sim_length)
+
+    def timed_simulate():
+        with profiler.phase('Cohort.simulate'):
+            simulate()
+
+    profiler.run(timed_simulate, stats_file_name=args.output + '.pstats')
+    if args.memory:
+        profiler.measure_memory('Cohort.simulate', simulate)
+    profiler.print_summary()
+    profiler.write_summary(file_name=args.output + '.json')
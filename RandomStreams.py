@@ -0,0 +1,70 @@
+""" counter-based random number streams
+
+the k-th uniform random number of a patient is a hash of (seed, cohort id, patient id, k),
+so a patient's stream needs no state (only an integer key) and random numbers of many
+patients can be generated together as arrays; the same patient receives the same random
+numbers whether it is simulated alone (Patient) or together with others (the batch engine)
+"""
+import numpy as np
+
+_MASK = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15    # increment of the splitmix64 generator
+_M1 = 0xBF58476D1CE4E5B9        # multipliers of the splitmix64 finalizer
+_M2 = 0x94D049BB133111EB
+
+
+def _mix(z):
+    """ splitmix64 finalizer of an integer (in [0, 2^64)) """
+    z = ((z ^ (z >> 30)) * _M1) & _MASK
+    z = ((z ^ (z >> 27)) * _M2) & _MASK
+    return z ^ (z >> 31)
+
+
+def _mix_array(z):
+    """ splitmix64 finalizer of an array of uint64 (multiplications wrap around 2^64) """
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(_M1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(_M2)
+    return z ^ (z >> np.uint64(31))
+
+
+def _get_cohort_key(cohort_id, seed):
+    return _mix((_mix(seed & _MASK) + cohort_id * _GOLDEN) & _MASK)
+
+
+def get_patient_key(patient_id, cohort_id, seed=0):
+    """ :returns (int) the key of the random number stream of a patient
+    :param patient_id: ID of the patient
+    :param cohort_id: ID of the cohort
+    :param seed: seed of all streams
+    """
+    return _mix((_get_cohort_key(cohort_id, seed) + patient_id * _GOLDEN) & _MASK)
+
+
+def get_patient_keys(patient_ids, cohort_id, seed=0):
+    """ :returns (array of uint64) keys of the random number streams of patients
+    :param patient_ids: (array) IDs of patients
+    :param cohort_id: ID of the cohort
+    :param seed: seed of all streams
+    """
+    ids = np.asarray(patient_ids).astype(np.uint64)
+    return _mix_array(np.uint64(_get_cohort_key(cohort_id, seed)) + ids * np.uint64(_GOLDEN))
+
+
+def get_uniform(key, counter):
+    """ :returns the uniform random number in [0, 1) at the position counter of a stream
+    :param key: (int) key of the stream
+    :param counter: position in the stream (0, 1, 2, ...)
+    """
+    return (_mix((key + (counter + 1) * _GOLDEN) & _MASK) >> 11) * 2.0 ** -53
+
+
+def get_uniforms(keys, counters):
+    """ :returns (array) uniform random numbers in [0, 1) at the specified positions of streams
+    :param keys: (array of uint64) keys of streams
+    :param counters: (int or array) position in each stream
+    """
+    if np.isscalar(counters):
+        offsets = np.uint64(((counters + 1) * _GOLDEN) & _MASK)
+    else:
+        offsets = (np.asarray(counters).astype(np.uint64) + np.uint64(1)) * np.uint64(_GOLDEN)
+    return (_mix_array(keys + offsets) >> np.uint64(11)) * 2.0 ** -53
@@ -0,0 +1,127 @@
+""" on-disk cache of simulated cohort outcomes
+
+outcomes of each simulated cohort are stored as .npy files (which are memory-mapped when loaded)
+in a folder named by the hash of the parameter values, cohort id, population size, number of
+time-steps, simulation options and the source code of the modules that simulate cohorts, so
+re-running an analysis with the same inputs loads the results instead of simulating the cohorts
+again (and changes to the engines or random streams never return outdated results).
+the least recently used results are removed when the cache grows larger than its maximum size.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# increase when a change in the model changes simulation outcomes (so old results are not used)
+# (changes to the source files in MODEL_SOURCE_FILES are detected without this)
+CACHE_VERSION = 1
+
+# source files (in the folder of this module) that determine simulation outcomes
+MODEL_SOURCE_FILES = ('MarkovModelClasses.py', 'ParameterClasses.py', 'RandomStreams.py')
+
+_codeHash = None    # hash of the source files that determine simulation outcomes (see get_code_hash)
+
+# arrays stored for each cohort (in the order returned by get and expected by put)
+ARRAY_NAMES = ('survival_times', 'costs', 'num_patients_alive')
+
+
+class ResultCache:
+    def __init__(self, cache_dir, max_size=500 * 2 ** 20):
+        """
+        :param cache_dir: folder to store results in
+        :param max_size: (bytes) maximum size of stored results
+        """
+        self.cacheDir = cache_dir
+        self.maxSize = max_size
+
+    def get_key(self, parameters, cohort_id, pop_size, n_time_steps, seed=0, **options):
+        """ :returns the key of results of a cohort
+        :param parameters: parameters of the cohort
+        :param cohort_id: cohort id (determines the random numbers patients receive)
+        :param pop_size: population size
+        :param n_time_steps: number of simulated time-steps
+        :param seed: seed of the random number streams of patients
+        :param options: other simulation options that change outcomes (e.g. sojourn_sampling=True)
+        """
+        description = '{}|{}|{}|{}|{}|{}|{}|{}'.format(
+            CACHE_VERSION, get_code_hash(), parameters.get_content_hash(), cohort_id, seed, pop_size, n_time_steps,
+            sorted(options.items()))
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def get(self, key):
+        """ :returns (survival times, costs, number of time-steps alive) of patients as
+        read-only memory-mapped arrays, or None if results with this key are not stored """
+        folder = os.path.join(self.cacheDir, key)
+        if not os.path.isdir(folder):
+            return None
+
+        try:
+            arrays = tuple(np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES)
+        except (OSError, ValueError):
+            # incomplete results (e.g. removed by another process)
+            return None
+
+        # mark as recently used
+        os.utime(folder)
+        return arrays
+
+    def put(self, key, survival_times, costs, num_patients_alive):
+        """ stores results of a cohort (and removes the least recently used results if the cache is full)
+        :param key: key of results (see get_key)
+        :param survival_times: survival times of patients (nan for patients who survived)
+        :param costs: discounted costs of patients
+        :param num_patients_alive: number of time-steps each patient was alive
+        """
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        # write to a temporary folder first so that other processes never find incomplete results
+        temp_folder = tempfile.mkdtemp(dir=self.cacheDir, prefix='.tmp')
+        for name, array in zip(ARRAY_NAMES, (survival_times, costs, num_patients_alive)):
+            np.save(os.path.join(temp_folder, name + '.npy'), np.asarray(array))
+        try:
+            os.rename(temp_folder, os.path.join(self.cacheDir, key))
+        except OSError:
+            # the same results were stored by another process
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """ removes the least recently used results until the cache is not larger than its maximum size
+        :param keep: key of results that should not be removed
+        """
+        entries = []  # (last used, size, folder)
+        for key in os.listdir(self.cacheDir):
+            folder = os.path.join(self.cacheDir, key)
+            if key.startswith('.') or not os.path.isdir(folder):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(folder))
+            entries.append((os.stat(folder).st_mtime, size, key))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total_size <= self.maxSize:
+                break
+            if key != keep:
+                shutil.rmtree(os.path.join(self.cacheDir, key), ignore_errors=True)
+                total_size -= size
+
+    def clear(self):
+        """ removes all stored results """
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+
+def get_code_hash():
+    """ :returns the hash of the source files that determine simulation outcomes
+    (read once per process) """
+    global _codeHash
+
+    if _codeHash is None:
+        hash_obj = hashlib.sha256()
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for file_name in MODEL_SOURCE_FILES:
+            with open(os.path.join(folder, file_name), 'rb') as file:
+                hash_obj.update(file.read())
+        _codeHash = hash_obj.hexdigest()
+    return _codeHash
@@ -0,0 +1,23 @@
+import InputData as D
+import PSAClasses as PSA
+import Support as Support
+
+
+if __name__ == '__main__':
+
+    # save figures to files (rendered in the background) instead of showing them
+    if D.HEADLESS_REPORTS:
+        Support.use_headless_reports(figure_dir=D.FIGURE_DIR)
+
+    # create the probabilistic sensitivity analysis
+    psa = PSA.PSA(n_iterations=D.PSA_N_ITERATIONS, pop_size=D.POP_SIZE, time_varying=D.TIME_VARYING)
+
+    # simulate a cohort of each therapy for every sampled parameter set
+    # (results are also written to a csv file as they arrive)
+    psa.simulate(n_time_steps=D.SIM_LENGTH, csv_file_name='PSAResults.csv')
+
+    # report the CEA and CBA results
+    Support.report_PSA_CEA_CBA(psa=psa)
+
+    # wait for figures that are still being rendered
+    Support.wait_for_reports()
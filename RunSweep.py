@@ -0,0 +1,32 @@
+import sys
+import InputData as D
+import SweepClasses as Sweep
+import Support as Support
+
+
+if __name__ == '__main__':
+
+    # scenario files (transition matrix variants, cost inputs, ...) can be passed as arguments;
+    # the inputs of InputData are used otherwise
+    scenarios = {file_name: file_name for file_name in sys.argv[1:]} or None
+
+    # sweep over scenarios, therapies, discount rates and simulation lengths
+    sweep = Sweep.Sweep(store_dir=D.SWEEP_STORE_DIR,
+                        scenarios=scenarios,
+                        discount_rates=D.SWEEP_DISCOUNT_RATES,
+                        sim_lengths=D.SWEEP_SIM_LENGTHS)
+
+    # simulate the cells that are not stored yet (on all cores)
+    rows = sweep.run()
+    print('Simulated cells:', len(rows))
+    if sweep.failedCells:
+        print('Failed cells:', len(sweep.failedCells))
+        for cell in sweep.failedCells:
+            print('')
+            print('Scenario {}, {}, discount {}, simulation length {}:'.format(
+                cell['scenario'], cell['therapy'], cell['discount'], cell['sim_length']))
+            print(cell['error'])
+    print('')
+
+    # report the mean outcomes of all stored cells
+    Support.print_sweep_table(rows=Sweep.query(store_dir=D.SWEEP_STORE_DIR))
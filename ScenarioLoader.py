@@ -0,0 +1,172 @@
+""" loads model inputs of scenarios from files (instead of editing InputData)
+
+a scenario file can be
+    - json: an object with any of the keys 'TRANS_MATRIX', 'ANNUAL_STATE_COST', 'Aminosalicylate_COST',
+            'Immunosuppresive_COST', 'DISCOUNT', 'SIM_LENGTH', 'POP_SIZE' (same names as in InputData)
+    - npz: arrays with any of the above names
+    - csv: the transition matrix (one row per health state, an optional header row)
+inputs not specified in the file are taken from InputData
+
+the values parsed from a file are cached by the hash of the file content (in memory and, optionally,
+as npz files in a cache folder), so loading the same scenario again skips parsing; inputs not specified
+in the file are filled from InputData (and validated) on every load, so that changes to InputData are
+not hidden by the cache; parameters built from the same inputs are also cached (see get_parameters)
+"""
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+import InputData as Data
+import ParameterClasses as P
+
+# names of inputs that can be specified in scenario files
+INPUT_NAMES = ['TRANS_MATRIX', 'ANNUAL_STATE_COST', 'Aminosalicylate_COST', 'Immunosuppresive_COST',
+               'DISCOUNT', 'SIM_LENGTH', 'POP_SIZE']
+
+_valuesCache = {}       # values parsed from scenario files by the hash of file content
+_parametersCache = {}   # parameters by (hash of inputs, therapy)
+
+
+class ModelInputs:
+    """ validated and read-only model inputs of a scenario
+    (attributes have the same names as the constants of InputData, so they can be used in its place) """
+    def __init__(self, values):
+        """
+        :param values: (dictionary) values of inputs (inputs not included are taken from InputData)
+        """
+        n_states = len(P.HealthStates)
+
+        self.TRANS_MATRIX = _read_only(values.get('TRANS_MATRIX', Data.TRANS_MATRIX), shape=(n_states, n_states))
+        self.ANNUAL_STATE_COST = _read_only(values.get('ANNUAL_STATE_COST', Data.ANNUAL_STATE_COST),
+                                            shape=(n_states,))
+        self.Aminosalicylate_COST = float(values.get('Aminosalicylate_COST', Data.Aminosalicylate_COST))
+        self.Immunosuppresive_COST = float(values.get('Immunosuppresive_COST', Data.Immunosuppresive_COST))
+        self.DISCOUNT = float(values.get('DISCOUNT', Data.DISCOUNT))
+        self.SIM_LENGTH = int(values.get('SIM_LENGTH', Data.SIM_LENGTH))
+        self.POP_SIZE = int(values.get('POP_SIZE', Data.POP_SIZE))
+
+        # hash of the input values (the same inputs have the same hash regardless of the file format)
+        self.contentHash = _hash_arrays([getattr(self, name) for name in INPUT_NAMES])
+
+    def validate(self):
+        """ raises a ValueError if inputs are not valid """
+        if np.any(self.TRANS_MATRIX < 0):
+            raise ValueError('Transition probabilities should not be negative.')
+        row_sums = self.TRANS_MATRIX.sum(axis=1)
+        for s, row_sum in enumerate(row_sums):
+            # rows of absorbing states (e.g. death) are all zeros
+            if row_sum != 0 and abs(row_sum - 1) > 0.00001:
+                raise ValueError('Transition probabilities out of state {} ({}) should sum to 1 (sum is {}).'
+                                 .format(s, P.HealthStates(s).name, row_sum))
+        if np.any(self.ANNUAL_STATE_COST < 0) or self.Aminosalicylate_COST < 0 or self.Immunosuppresive_COST < 0:
+            raise ValueError('Costs should not be negative.')
+        if self.DISCOUNT < 0:
+            raise ValueError('Discount rate should not be negative.')
+        if self.SIM_LENGTH <= 0 or self.POP_SIZE <= 0:
+            raise ValueError('Simulation length and population size should be positive.')
+
+    def to_dict(self):
+        """ :returns (dictionary) values of inputs """
+        return {name: getattr(self, name) for name in INPUT_NAMES}
+
+
+def get_default_inputs():
+    """ :returns inputs defined in InputData """
+    return ModelInputs(values={})
+
+
+def load_inputs(file_name, cache_dir=None):
+    """ loads (or finds in the cache) the inputs of a scenario file
+    :param file_name: name of a json, npz or csv scenario file
+    :param cache_dir: (optional) folder to store the parsed values in, so that other runs can skip
+                      parsing the same file
+    :returns ModelInputs
+    """
+    with open(file_name, 'rb') as file:
+        content = file.read()
+    file_hash = hashlib.sha256(content).hexdigest()
+
+    # only the values in the file are cached (not the defaults taken from InputData, which may change)
+    cache_file_name = None if cache_dir is None else os.path.join(cache_dir, file_hash + '.npz')
+    if file_hash in _valuesCache:
+        # file already parsed by this process
+        values = _valuesCache[file_hash]
+    elif cache_file_name is not None and os.path.exists(cache_file_name):
+        # file parsed by another run
+        with np.load(cache_file_name) as cached:
+            values = {name: cached[name] for name in cached.files}
+    else:
+        values = _parse(file_name=file_name, content=content)
+
+    # fill inputs not in the file from InputData
+    inputs = ModelInputs(values=values)
+    inputs.validate()
+
+    # cache values only once they are valid
+    if file_hash not in _valuesCache and cache_file_name is not None and not os.path.exists(cache_file_name):
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_file_name, **values)
+    _valuesCache[file_hash] = values
+    return inputs
+
+
+def get_parameters(therapy, inputs=None, time_varying=False):
+    """ :returns parameters of a therapy built from the specified inputs (parameters built from
+    the same inputs are reused, since parameters are not modified during simulation)
+    :param therapy: selected therapy
+    :param inputs: ModelInputs (inputs defined in InputData if None)
+    :param time_varying: set to True to use time-varying transition probabilities
+    """
+    if inputs is None:
+        inputs = get_default_inputs()
+
+    key = (inputs.contentHash, therapy, time_varying)
+    if key not in _parametersCache:
+        _parametersCache[key] = P.ParametersFixed(therapy=therapy, inputs=inputs, time_varying=time_varying)
+    return _parametersCache[key]
+
+
+def _parse(file_name, content):
+    """ :returns (dictionary) values of inputs in a scenario file """
+    extension = os.path.splitext(file_name)[1].lower()
+
+    if extension == '.json':
+        values = json.loads(content.decode('utf-8'))
+    elif extension == '.npz':
+        with np.load(file_name) as arrays:
+            values = {name: arrays[name] for name in arrays.files}
+    elif extension == '.csv':
+        rows = [row for row in csv.reader(content.decode('utf-8').splitlines()) if row]
+        # skip the header row if it is not numeric
+        try:
+            float(rows[0][0])
+        except ValueError:
+            rows = rows[1:]
+        values = {'TRANS_MATRIX': [[float(x) for x in row] for row in rows]}
+    else:
+        raise ValueError('Scenario files should be json, npz or csv files: ' + file_name)
+
+    unknown = set(values) - set(INPUT_NAMES)
+    if unknown:
+        raise ValueError('Unknown inputs in {}: {}'.format(file_name, ', '.join(sorted(unknown))))
+    return values
+
+
+def _read_only(values, shape):
+    """ :returns a read-only array of floats with the specified shape (raises a ValueError otherwise) """
+    array = np.array(values, dtype=float)
+    if array.shape != shape:
+        raise ValueError('Expected an input of shape {} but found {}.'.format(shape, array.shape))
+    array.setflags(write=False)
+    return array
+
+
+def _hash_arrays(arrays):
+    """ :returns sha256 hash of the content of arrays """
+    hash_obj = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype=float)
+        hash_obj.update(str(array.shape).encode())
+        hash_obj.update(array.tobytes())
+    return hash_obj.hexdigest()
@@ -1,9 +1,81 @@
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import InputData as D
-import SimPy.SamplePathClasses as PathCls
-import SimPy.FigureSupport as Figs
+import CEAClasses as CE
+import BootstrapClasses as Boot
 import SimPy.StatisticalClasses as Stat
-import SimPy.EconEvalClasses as Econ
-import matplotlib.pyplot as plt
+
+# matplotlib and the SimPy plotting modules are imported only when a figure is drawn
+# (survival curves of cohort outcomes are also built only when they are requested for a figure)
+
+# reporting options (see use_headless_reports)
+_figureDir = None   # folder to save figures to (None to show figures interactively)
+_renderer = None    # background worker that renders figures
+_renderJobs = []    # figures submitted to the background worker
+
+
+def use_headless_reports(figure_dir='figures', in_background=True):
+    """ renders figures to files with the non-interactive Agg backend instead of showing them
+    :param figure_dir: folder to save figures to
+    :param in_background: set to True to render figures in a background worker so that the program
+                          (e.g. the simulation of the next scenario) continues while figures are drawn
+    """
+    global _figureDir, _renderer
+
+    import matplotlib
+    matplotlib.use('Agg')
+    # plt.show() does nothing with the Agg backend; the figures are saved instead
+    warnings.filterwarnings('ignore', message='.*non-interactive.*')
+
+    _figureDir = figure_dir
+    os.makedirs(figure_dir, exist_ok=True)
+
+    # a single worker so that pyplot is only used by one thread
+    if in_background and _renderer is None:
+        _renderer = ThreadPoolExecutor(max_workers=1)
+    elif not in_background and _renderer is not None:
+        wait_for_reports()
+        _renderer.shutdown()
+        _renderer = None
+
+
+def wait_for_reports():
+    """ waits until all figures submitted to the background worker are rendered
+    (raises the error of any figure that failed) """
+    global _renderJobs
+
+    jobs = _renderJobs
+    _renderJobs = []
+    for job in jobs:
+        job.result()
+
+
+def _render(draw, file_name):
+    """ draws a figure; in the headless mode, saves it to a file (in the background if requested)
+    :param draw: function that draws the figure
+    :param file_name: name of the file (in the figure folder) to save the figure to in the headless mode
+    """
+    if _figureDir is None:
+        draw()
+        return
+
+    # the folder is found now in case it is changed before the background worker renders this figure
+    path = os.path.join(_figureDir, file_name)
+    if _renderer is not None:
+        _renderJobs.append(_renderer.submit(_draw_and_save, draw, path))
+    else:
+        _draw_and_save(draw, path)
+
+
+def _draw_and_save(draw, path):
+    """ draws a figure and saves it to the specified path """
+    import matplotlib.pyplot as plt
+
+    draw()
+    plt.gcf().savefig(path)
+    plt.close('all')
 
 
 def print_outcomes(sim_outcomes, therapy_name):
@@ -54,13 +126,16 @@ def plot_survival_curves_and_histograms(sim_outcomes_amino, sim_outcomes_immuno)
     ]
 
     # graph survival curve
-    PathCls.graph_sample_paths(
-        sample_paths=survival_curves,
-        title='Survival curve',
-        x_label='Simulation time step (year)',
-        y_label='Number of alive patients',
-        legends=['Aminosalicylate Therapy', 'Immunosuppresive Therapy']
-    )
+    def draw_survival_curves():
+        import SimPy.SamplePathClasses as PathCls
+        PathCls.graph_sample_paths(
+            sample_paths=survival_curves,
+            title='Survival curve',
+            x_label='Simulation time step (year)',
+            y_label='Number of alive patients',
+            legends=['Aminosalicylate Therapy', 'Immunosuppresive Therapy']
+        )
+    _render(draw=draw_survival_curves, file_name='Survival curve.png')
 
     # histograms of survival times
     set_of_survival_times = [
@@ -69,40 +144,55 @@ def plot_survival_curves_and_histograms(sim_outcomes_amino, sim_outcomes_immuno)
     ]
 
     # graph histograms
-    Figs.graph_histograms(
-        data_sets=set_of_survival_times,
-        title='Histogram of patient survival time',
-        x_label='Survival time (year)',
-        y_label='Counts',
-        bin_width=1,
-        legends=['Aminosalicylate Therapy', 'Immunosuppresive Therapy'],
-        transparency=0.6
-    )
-
-
-def print_comparative_outcomes(sim_outcomes_amino, sim_outcomes_immuno):
+    def draw_histograms():
+        import SimPy.FigureSupport as Figs
+        Figs.graph_histograms(
+            data_sets=set_of_survival_times,
+            title='Histogram of patient survival time',
+            x_label='Survival time (year)',
+            y_label='Counts',
+            bin_width=1,
+            legends=['Aminosalicylate Therapy', 'Immunosuppresive Therapy'],
+            transparency=0.6
+        )
+    _render(draw=draw_histograms, file_name='Histogram of patient survival time.png')
+
+
+def print_comparative_outcomes(sim_outcomes_amino, sim_outcomes_immuno, if_paired=False):
     """ prints average increase in survival time, discounted cost, and discounted utility
     under immunosuppresive therapy compared to aminosalicylate therapy
     :param sim_outcomes_amino: outcomes of a cohort simulated under mono therapy
     :param sim_outcomes_immuno: outcomes of a cohort simulated under combination therapy
+    :param if_paired: set to True if both cohorts are simulated with common random numbers
+                      (patient i of both cohorts receives the same random numbers)
     """
 
     # increase in mean survival time under immuno therapy with respect to amino therapy
-    increase_survival_time = Stat.DifferenceStatIndp(
-        name='Increase in mean survival time',
-        x=sim_outcomes_immuno.survivalTimes,
-        y_ref=sim_outcomes_amino.survivalTimes)
+    if if_paired:
+        # survival times are paired by patient only if survivors are included (censored at the end of simulation)
+        increase_survival_time = Stat.DifferenceStatPaired(
+            name='Increase in mean restricted survival time',
+            x=sim_outcomes_immuno.get_restricted_survival_times(),
+            y_ref=sim_outcomes_amino.get_restricted_survival_times())
+    else:
+        increase_survival_time = Stat.DifferenceStatIndp(
+            name='Increase in mean survival time',
+            x=sim_outcomes_immuno.survivalTimes,
+            y_ref=sim_outcomes_amino.survivalTimes)
 
     # estimate and CI
     estimate_CI = increase_survival_time.get_formatted_mean_and_interval(interval_type='c',
                                                                          alpha=D.ALPHA,
                                                                          deci=2)
-    print("Increase in mean survival time and {:.{prec}%} confidence interval:"
-          .format(1 - D.ALPHA, prec=0),
+    print("Increase in mean {}survival time and {:.{prec}%} confidence interval:"
+          .format('restricted ' if if_paired else '', 1 - D.ALPHA, prec=0),
           estimate_CI)
 
+    # paired or independent differences
+    difference_stat = Stat.DifferenceStatPaired if if_paired else Stat.DifferenceStatIndp
+
     # increase in mean discounted cost under immuno therapy with respect to amino therapy
-    increase_discounted_cost = Stat.DifferenceStatIndp(
+    increase_discounted_cost = difference_stat(
         name='Increase in mean discounted cost',
         x=sim_outcomes_immuno.costs,
         y_ref=sim_outcomes_amino.costs)
@@ -117,7 +207,7 @@ def print_comparative_outcomes(sim_outcomes_amino, sim_outcomes_immuno):
           estimate_CI)
     #
     # increase in number of patients alive under immuno therapy with respect to amino therapy
-    increase_patients_alive = Stat.DifferenceStatIndp(
+    increase_patients_alive = difference_stat(
         name='Increase in mean number of patients alive',
         x=sim_outcomes_immuno.numPatientsAlive,
         y_ref=sim_outcomes_amino.numPatientsAlive)
@@ -131,11 +221,51 @@ def print_comparative_outcomes(sim_outcomes_amino, sim_outcomes_immuno):
           estimate_CI)
 
 
-def report_CEA_CBA(sim_outcomes_amino, sim_outcomes_immuno):
+def print_bootstrap_outcomes(sim_outcomes_amino, sim_outcomes_immuno, if_paired=False):
+    """ prints bootstrap percentile intervals of mean discounted costs, the increase in mean cost and
+    number of patients alive, and the ICER of immunosuppresive therapy (percentile intervals
+    do not assume the distribution of costs is symmetric)
+    :param sim_outcomes_amino: outcomes of a cohort simulated under aminosalicylate therapy
+    :param sim_outcomes_immuno: outcomes of a cohort simulated under immunosuppresive therapy
+    :param if_paired: set to True if both cohorts are simulated with common random numbers
+    """
+    bootstrap = Boot.Bootstrap(n_replicates=D.BOOTSTRAP_N_REPLICATES, alpha=D.ALPHA, seed=D.BOOTSTRAP_SEED)
+
+    estimates = [
+        ('Mean discounted cost (aminosalicylate)', 0,
+         bootstrap.get_mean_interval(x=sim_outcomes_amino.costs)),
+        ('Mean discounted cost (immunosuppresive)', 0,
+         bootstrap.get_mean_interval(x=sim_outcomes_immuno.costs)),
+        ('Increase in mean discounted cost', 0,
+         bootstrap.get_difference_interval(x=sim_outcomes_immuno.costs,
+                                           y_ref=sim_outcomes_amino.costs,
+                                           if_paired=if_paired)),
+        ('Increase in mean number of patients alive', 2,
+         bootstrap.get_difference_interval(x=sim_outcomes_immuno.numPatientsAlive,
+                                           y_ref=sim_outcomes_amino.numPatientsAlive,
+                                           if_paired=if_paired)),
+        ('ICER', 2,
+         bootstrap.get_ratio_interval(x_costs=sim_outcomes_immuno.costs,
+                                      x_effects=sim_outcomes_immuno.numPatientsAlive,
+                                      y_costs=sim_outcomes_amino.costs,
+                                      y_effects=sim_outcomes_amino.numPatientsAlive,
+                                      if_paired=if_paired)),
+    ]
+
+    for name, deci, (mean, lower, upper) in estimates:
+        text = '{:,.' + str(deci) + 'f}'
+        print("{} and {:.{prec}%} bootstrap percentile interval:".format(name, 1 - D.ALPHA, prec=0),
+              (text + ' (' + text + ', ' + text + ')').format(mean, lower, upper))
+    print("")
+
+
+def report_CEA_CBA(sim_outcomes_amino, sim_outcomes_immuno, if_paired=False):
     """ performs cost-effectiveness and cost-benefit analyses
     :param sim_outcomes_amino: outcomes of a cohort simulated under aminosalicylate therapy
     :param sim_outcomes_immuno: outcomes of a cohort simulated under immunosuppresive therapy
+    :param if_paired: set to True if both cohorts are simulated with common random numbers
     """
+    import SimPy.EconEvalClasses as Econ
 
     # define two strategies
     amino_therapy_strategy = Econ.Strategy(
@@ -154,12 +284,9 @@ def report_CEA_CBA(sim_outcomes_amino, sim_outcomes_immuno):
     # do CEA
     CEA = Econ.CEA(
         strategies=[amino_therapy_strategy, immuno_therapy_strategy],
-        if_paired=False
+        if_paired=if_paired
     )
 
-    # show the cost-effectiveness plane
-    show_ce_figure(CEA=CEA)
-
     # report the CE table
     CEA.build_CE_table(
         interval_type='c',
@@ -168,25 +295,133 @@ def report_CEA_CBA(sim_outcomes_amino, sim_outcomes_immuno):
         effect_digits=2,
         icer_digits=2)
 
-    # CBA
-    NBA = Econ.CBA(
-        strategies=[amino_therapy_strategy, immuno_therapy_strategy],
-        if_paired=False
-    )
+    # show the cost-effectiveness plane
+    show_ce_figure(CEA=CEA)
+
+    # CBA: incremental net monetary benefit of immuno therapy with respect to amino therapy
+    wtp_values = np.linspace(D.WTP_RANGE[0], D.WTP_RANGE[1], D.N_WTP_VALUES)
+    nmb = CE.get_incremental_nmb(costs=sim_outcomes_immuno.costs,
+                                 effects=sim_outcomes_immuno.numPatientsAlive,
+                                 ref_costs=sim_outcomes_amino.costs,
+                                 ref_effects=sim_outcomes_amino.numPatientsAlive,
+                                 wtp_values=wtp_values,
+                                 if_paired=if_paired,
+                                 interval_type='c',
+                                 alpha=D.ALPHA)
     # show the net monetary benefit figure
-    NBA.graph_incremental_NMBs(
-        min_wtp=0,
-        max_wtp=50000,
-        title='Cost-Benefit Analysis',
-        x_label='Willingness-to-pay for one additional QALY ($)',
-        y_label='Incremental Net Monetary Benefit ($)',
-        interval_type='c',
-        show_legend=True,
-        figure_size=(6, 5)
+    _render(draw=lambda: _draw_incremental_nmb(wtp_values=wtp_values, nmb=nmb),
+            file_name='Cost-Benefit Analysis.png')
+
+
+def report_PSA_CEA_CBA(psa):
+    """ performs cost-effectiveness and cost-benefit analyses on the results of a probabilistic
+    sensitivity analysis (the mean cost and effect of each PSA iteration are the observations)
+    :param psa: a simulated PSA (from PSAClasses) of aminosalicylate and immunosuppresive therapies
+    """
+    import SimPy.EconEvalClasses as Econ
+
+    # define two strategies (the same parameter set is used for both therapies in each iteration)
+    strategies = psa.get_strategies(names=['Aminosalicylate Therapy', 'Immunosuppresive Therapy'],
+                                    colors=['green', 'blue'])
+
+    # do CEA
+    CEA = Econ.CEA(
+        strategies=strategies,
+        if_paired=True
     )
 
+    # report the CE table (with percentile intervals over PSA iterations)
+    CEA.build_CE_table(
+        interval_type='p',
+        alpha=D.ALPHA,
+        cost_digits=0,
+        effect_digits=2,
+        icer_digits=2)
+
+    # show the cost-effectiveness plane
+    show_ce_figure(CEA=CEA, file_name='PSA Cost-Effectiveness Analysis.png')
+
+    # CBA: incremental net monetary benefit of immuno therapy with respect to amino therapy
+    # (with percentile intervals over PSA iterations)
+    wtp_values = np.linspace(D.WTP_RANGE[0], D.WTP_RANGE[1], D.N_WTP_VALUES)
+    nmb = CE.get_incremental_nmb(costs=psa.meanCosts[1], effects=psa.meanEffects[1],
+                                 ref_costs=psa.meanCosts[0], ref_effects=psa.meanEffects[0],
+                                 wtp_values=wtp_values,
+                                 if_paired=True,
+                                 interval_type='p',
+                                 alpha=D.ALPHA)
+    # show the net monetary benefit figure
+    _render(draw=lambda: _draw_incremental_nmb(wtp_values=wtp_values, nmb=nmb),
+            file_name='PSA Cost-Benefit Analysis.png')
+
+    # show the cost-effectiveness acceptability curves
+    plot_acceptability_curves(psa=psa, names=['Aminosalicylate Therapy', 'Immunosuppresive Therapy'],
+                              colors=['green', 'blue'])
+
+
+def plot_acceptability_curves(psa, names, colors):
+    """ draws the probability that each therapy is the most cost-effective at each willingness-to-pay value
+    :param psa: a simulated PSA (from PSAClasses)
+    :param names: (list) names of therapies
+    :param colors: (list) colors of therapies
+    """
+    wtp_values = np.linspace(D.WTP_RANGE[0], D.WTP_RANGE[1], D.N_WTP_VALUES)
+    probs = CE.get_acceptability_curves(costs=psa.meanCosts, effects=psa.meanEffects, wtp_values=wtp_values)
+
+    def draw_acceptability_curves():
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(6, 5))
+        for prob, name, color in zip(probs, names, colors):
+            plt.plot(wtp_values, prob, c=color, label=name)
+        plt.ylim([0, 1])
+        plt.legend()
+        plt.title('Cost-Effectiveness Acceptability Curves')
+        plt.xlabel('Willingness-to-pay for one additional QALY ($)')
+        plt.ylabel('Probability of being the most cost-effective')
+        plt.show()
+    _render(draw=draw_acceptability_curves, file_name='PSA Acceptability Curves.png')
+
+
+def _draw_incremental_nmb(wtp_values, nmb):
+    """ draws the incremental net monetary benefit of immuno therapy and its interval
+    :param wtp_values: (array) willingness-to-pay values
+    :param nmb: (means, lower bounds, upper bounds) of the incremental net monetary benefit (see CEAClasses)
+    """
+    import matplotlib.pyplot as plt
+
+    means, lowers, uppers = nmb
+    plt.figure(figsize=(6, 5))
+    plt.plot(wtp_values, means, c='blue', label='Immunosuppresive Therapy')
+    plt.fill_between(wtp_values, lowers, uppers, color='blue', alpha=0.2)
+    plt.axhline(y=0, c='k', linewidth=0.5)  # horizontal line at y = 0
+    plt.legend()
+    plt.title('Cost-Benefit Analysis')
+    plt.xlabel('Willingness-to-pay for one additional QALY ($)')
+    plt.ylabel('Incremental Net Monetary Benefit ($)')
+    plt.show()
+
+
+def print_sweep_table(rows):
+    """ prints the mean outcomes of cells of a sweep
+    :param rows: (list) rows of the index of a sweep store (see SweepClasses.query)
+    """
+    print('{:<15} {:<18} {:>8} {:>10} {:>14} {:>12} {:>10}'.format(
+        'Scenario', 'Therapy', 'Discount', 'Sim length', 'Mean cost', 'Mean effect', 'P(death)'))
+    for row in sorted(rows, key=lambda r: (r['scenario'], r['discount'], r['sim_length'], r['therapy'])):
+        print('{:<15} {:<18} {:>8.3f} {:>10d} {:>14,.0f} {:>12.2f} {:>10.3f}'.format(
+            row['scenario'], row['therapy'], row['discount'], row['sim_length'],
+            row['mean_cost'], row['mean_effect'], row['prob_death']))
+    print('')
+
+
+def show_ce_figure(CEA, file_name='Cost-Effectiveness Analysis.png'):
+    """ draws the cost-effectiveness plane (or saves it to a file in the headless mode) """
+    _render(draw=lambda: _draw_ce_figure(CEA=CEA), file_name=file_name)
+
 
-def show_ce_figure(CEA):
+def _draw_ce_figure(CEA):
+    import matplotlib.pyplot as plt
 
     # create a cost-effectiveness plot
     plt.figure(figsize=(5, 5))
@@ -0,0 +1,237 @@
+""" sweeps over combinations of scenarios, therapies, discount rates and simulation lengths
+
+each combination (cell) is simulated as a job on a pool of worker processes; outcomes of each cell
+are stored in an .npz file and a row of mean outcomes is added to an index (csv) of the store.
+cells found in the store are not simulated again (so an interrupted sweep continues where it
+stopped), and cells that fail are retried (also when a worker process dies, e.g. out of memory).
+all cells use the same cohort id, so patients receive common random numbers across cells.
+"""
+import csv
+import hashlib
+import itertools
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import InputData as D
+import ParameterClasses as P
+import MarkovModelClasses as Cls
+import ScenarioLoader as Scenarios
+
+INDEX_FILE_NAME = 'index.csv'
+INDEX_COLUMNS = ['key', 'scenario', 'therapy', 'discount', 'sim_length', 'pop_size',
+                 'mean_cost', 'mean_effect', 'mean_survival_time', 'prob_death']
+
+
+class Sweep:
+    def __init__(self, store_dir, scenarios=None, therapies=None, discount_rates=None, sim_lengths=None,
+                 pop_size=D.POP_SIZE, vectorized=True):
+        """
+        :param store_dir: folder to store outcomes of cells in
+        :param scenarios: (dictionary) name of each scenario -> its ModelInputs or scenario file
+                          (transition matrix variants, cost inputs, ...); inputs of InputData if None
+        :param therapies: (list) therapies to simulate (all therapies if None)
+        :param discount_rates: (list) discount rates (None in the list uses the scenario's rate)
+        :param sim_lengths: (list) simulation lengths (None in the list uses the scenario's length)
+        :param pop_size: population size of each cell
+        :param vectorized: set to True to simulate cells with the batch engine
+        """
+        if scenarios is None:
+            scenarios = {'base': Scenarios.get_default_inputs()}
+        self.scenarios = {name: Scenarios.load_inputs(file_name=inputs) if isinstance(inputs, str) else inputs
+                          for name, inputs in scenarios.items()}
+        self.therapies = list(P.Therapies) if therapies is None else therapies
+        self.discountRates = [None] if discount_rates is None else discount_rates
+        self.simLengths = [None] if sim_lengths is None else sim_lengths
+        self.popSize = pop_size
+        self.vectorized = vectorized
+        self.storeDir = store_dir
+
+        self.failedCells = []   # cells that failed after all retries (with the traceback of the last error)
+
+    def get_cells(self):
+        """ :returns (list) cells of the sweep as dictionaries with the scenario name, therapy,
+        discount rate, simulation length, inputs and key of the cell """
+        cells = []
+        for name, therapy, discount, sim_length in itertools.product(
+                self.scenarios, self.therapies, self.discountRates, self.simLengths):
+            values = self.scenarios[name].to_dict()
+            if discount is not None:
+                values['DISCOUNT'] = discount
+            if sim_length is not None:
+                values['SIM_LENGTH'] = sim_length
+            inputs = Scenarios.ModelInputs(values=values)
+
+            cells.append({'scenario': name,
+                          'therapy': therapy.name,
+                          'discount': inputs.DISCOUNT,
+                          'sim_length': inputs.SIM_LENGTH,
+                          'pop_size': self.popSize,
+                          'inputs': inputs,
+                          'key': _get_cell_key(inputs=inputs, therapy=therapy, pop_size=self.popSize)})
+        return cells
+
+    def run(self, n_workers=None, max_retries=2):
+        """ simulates the cells that are not in the store yet
+        :param n_workers: number of worker processes (None uses all cores, 1 simulates in this process)
+        :param max_retries: number of times a failed cell is simulated again
+        :returns (list) rows of the index of cells simulated in this run
+        """
+        os.makedirs(os.path.join(self.storeDir, 'cells'), exist_ok=True)
+
+        # skip cells that are already stored (and cells with the same key as an earlier cell,
+        # e.g. two scenarios with identical inputs, since they have the same outcomes)
+        seen_keys = {row['key'] for row in query(store_dir=self.storeDir)}
+        to_simulate = []
+        for cell in self.get_cells():
+            if cell['key'] not in seen_keys:
+                seen_keys.add(cell['key'])
+                to_simulate.append(cell)
+
+        rows = []
+        self.failedCells = []
+        index_file_name = os.path.join(self.storeDir, INDEX_FILE_NAME)
+        if_new_index = not os.path.exists(index_file_name)
+        with open(index_file_name, 'a', newline='') as index_file:
+            writer = csv.DictWriter(index_file, fieldnames=INDEX_COLUMNS)
+            if if_new_index:
+                writer.writeheader()
+
+            def record(row):
+                # rows are written as cells complete so that finished cells are kept if the sweep stops
+                writer.writerow(row)
+                index_file.flush()
+                rows.append(row)
+
+            if n_workers == 1:
+                for cell in to_simulate:
+                    for attempt in range(max_retries + 1):
+                        try:
+                            record(_simulate_cell(cell, self.storeDir, self.vectorized))
+                            break
+                        except Exception:
+                            if attempt == max_retries:
+                                self.failedCells.append(dict(cell, error=traceback.format_exc()))
+            else:
+                executor = ProcessPoolExecutor(max_workers=n_workers)
+                attempts = {cell['key']: 0 for cell in to_simulate}
+                futures = {}
+
+                def retry(cell, error):
+                    # simulate the cell again unless it has used all its retries
+                    attempts[cell['key']] += 1
+                    if attempts[cell['key']] <= max_retries:
+                        futures[executor.submit(_simulate_cell, cell, self.storeDir, self.vectorized)] = cell
+                    else:
+                        self.failedCells.append(dict(cell, error=error))
+
+                try:
+                    for cell in to_simulate:
+                        futures[executor.submit(_simulate_cell, cell, self.storeDir, self.vectorized)] = cell
+
+                    while futures:
+                        future = next(as_completed(futures))
+                        cell = futures.pop(future)
+                        try:
+                            record(future.result())
+                        except BrokenProcessPool:
+                            # a worker process died (e.g. killed when out of memory), so the pool cannot
+                            # run any more jobs: keep the cells that completed and start a new pool for the
+                            # others (it is not known which cell killed the worker, so all are retried)
+                            error = traceback.format_exc()
+                            executor.shutdown(wait=True)
+                            pending = [(future, cell)] + list(futures.items())
+                            futures.clear()
+                            executor = ProcessPoolExecutor(max_workers=n_workers)
+                            for pending_future, pending_cell in pending:
+                                if pending_future.done() and pending_future.exception() is None:
+                                    record(pending_future.result())
+                                else:
+                                    retry(pending_cell, error)
+                        except Exception:
+                            # the traceback includes the one raised in the worker process
+                            retry(cell, traceback.format_exc())
+                finally:
+                    executor.shutdown(wait=True)
+
+        return rows
+
+
+def query(store_dir, **conditions):
+    """ :returns (list) rows of the index of a store (as dictionaries) that meet the conditions
+    :param store_dir: folder of the store
+    :param conditions: values of columns to select rows (e.g. therapy='AMINOSALICYLATE', discount=0.03)
+    """
+    index_file_name = os.path.join(store_dir, INDEX_FILE_NAME)
+    if not os.path.exists(index_file_name):
+        return []
+
+    rows = []
+    with open(index_file_name, newline='') as index_file:
+        for row in csv.DictReader(index_file):
+            row = _parse_row(row)
+            if all(row[column] == value for column, value in conditions.items()):
+                rows.append(row)
+    return rows
+
+
+def load_outcomes(store_dir, key):
+    """ :returns CohortOutcomes of a stored cell (that can be reported with Support functions)
+    :param store_dir: folder of the store
+    :param key: key of the cell (see query)
+    """
+    with np.load(_get_cell_file_name(store_dir, key)) as arrays:
+        outcomes = Cls.CohortOutcomes()
+        outcomes.record_outcomes(survival_times=arrays['survival_times'],
+                                 costs=arrays['costs'],
+                                 num_patients_alive=arrays['num_patients_alive'])
+    return outcomes
+
+
+def _simulate_cell(cell, store_dir, vectorized):
+    """ simulates a cell (in a worker process), stores its outcomes and returns its row of the index """
+    therapy = P.Therapies[cell['therapy']]
+    inputs = cell['inputs']
+
+    cohort = Cls.Cohort(id=0, pop_size=cell['pop_size'],
+                        parameters=Scenarios.get_parameters(therapy=therapy, inputs=inputs),
+                        vectorized=vectorized)
+    cohort.simulate(n_time_steps=inputs.SIM_LENGTH)
+    outcomes = cohort.cohortOutcomes
+
+    # write to a temporary file first so that the store never has incomplete cells
+    file_name = _get_cell_file_name(store_dir, cell['key'])
+    temp_file_name = file_name + '.tmp.npz'
+    np.savez(temp_file_name,
+             survival_times=outcomes.patientSurvivalTimes,
+             costs=outcomes.costs,
+             num_patients_alive=outcomes.numPatientsAlive)
+    os.replace(temp_file_name, file_name)
+
+    row = {column: cell[column] for column in INDEX_COLUMNS if column in cell}
+    row['mean_cost'] = outcomes.costs.mean()
+    row['mean_effect'] = outcomes.numPatientsAlive.mean()
+    row['mean_survival_time'] = outcomes.survivalTimes.mean() if len(outcomes.survivalTimes) > 0 else np.nan
+    row['prob_death'] = len(outcomes.survivalTimes) / len(outcomes.costs)
+    return row
+
+
+def _get_cell_key(inputs, therapy, pop_size):
+    """ :returns the key of a cell (cells with the same inputs, therapy and population size have the same key) """
+    description = '{}|{}|{}'.format(inputs.contentHash, therapy.name, pop_size)
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def _get_cell_file_name(store_dir, key):
+    return os.path.join(store_dir, 'cells', key + '.npz')
+
+
+def _parse_row(row):
+    """ converts the values of a row read from the index to numbers """
+    parsed = dict(row)
+    for column in ('discount', 'mean_cost', 'mean_effect', 'mean_survival_time', 'prob_death'):
+        parsed[column] = float(row[column])
+    for column in ('sim_length', 'pop_size'):
+        parsed[column] = int(row[column])
+    return parsed
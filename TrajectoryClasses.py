@@ -0,0 +1,109 @@
+""" recording and analysis of patients' health state trajectories
+
+the health state of each patient at time-steps 0, 1, ..., n_time_steps is stored as uint8 in a
+memory-mapped .npy array of shape (patients, n_time_steps + 1) on disk, written one chunk of patients
+at a time, so new outcomes (time in a state, number of relapses, state occupancy, ...) can be
+calculated from the file without simulating the cohort again.
+"""
+import numpy as np
+import ParameterClasses as P
+
+# value of time-steps at which no change of health state was recorded (filled with the previous state)
+UNSET = 255
+
+# health states in which the disease is in remission (a relapse is a move from these to an active state)
+REMISSION_STATES = [P.HealthStates.REMISSION.value, P.HealthStates.POST_SURGERY_REMISSION.value]
+
+
+class TrajectoryRecorder:
+    def __init__(self, file_name, n_patients, n_time_steps):
+        """
+        :param file_name: name of the .npy file to write trajectories to
+        :param n_patients: number of patients
+        :param n_time_steps: number of simulated time-steps
+        """
+        self.fileName = file_name
+        self.nPatients = n_patients
+        self.nTimeSteps = n_time_steps
+        self.trajectories = np.lib.format.open_memmap(file_name, mode='w+', dtype=np.uint8,
+                                                      shape=(n_patients, n_time_steps + 1))
+
+    def get_buffer(self, n_patients, initial_state):
+        """ :returns an array for the engine to record the changes of health states of a chunk of patients
+        (only the time-steps at which states change need to be recorded; see append)
+        :param n_patients: number of patients in the chunk
+        :param initial_state: index of the initial health state
+        """
+        buffer = np.full((n_patients, self.nTimeSteps + 1), UNSET, dtype=np.uint8)
+        buffer[:, 0] = initial_state
+        return buffer
+
+    def append(self, first_index, buffer):
+        """ writes the trajectories of a chunk of patients to the file
+        (the state at time-steps with no recorded change is the state at the previous time-step)
+        :param first_index: position of the first patient of the chunk in the file
+        :param buffer: array returned by get_buffer with the recorded changes of health states
+        """
+        # index of the last time-step at which a state was recorded
+        time_steps = np.where(buffer != UNSET, np.arange(buffer.shape[1]), 0)
+        np.maximum.accumulate(time_steps, axis=1, out=time_steps)
+        self.trajectories[first_index:first_index + len(buffer)] = \
+            np.take_along_axis(buffer, time_steps, axis=1)
+
+    def close(self):
+        """ writes the remaining trajectories to disk """
+        self.trajectories.flush()
+
+
+def load_trajectories(file_name):
+    """ :returns (read-only memory-mapped array of shape (patients, time-steps + 1)) recorded trajectories """
+    return np.load(file_name, mmap_mode='r')
+
+
+def get_time_in_state(trajectories, state, chunk_size=100000):
+    """ :returns (array) number of time-steps each patient started in the specified state
+    :param trajectories: recorded trajectories (see load_trajectories)
+    :param state: index of the health state
+    :param chunk_size: number of patients read from the file at a time
+    """
+    return np.concatenate([(chunk[:, :-1] == state).sum(axis=1)
+                           for chunk in _get_chunks(trajectories, chunk_size)])
+
+
+def get_relapse_counts(trajectories, remission_states=None, chunk_size=100000):
+    """ :returns (array) number of relapses of each patient (moves from a state of remission
+    to a state of active disease)
+    :param trajectories: recorded trajectories (see load_trajectories)
+    :param remission_states: (list) indices of states of remission (REMISSION_STATES if None)
+    :param chunk_size: number of patients read from the file at a time
+    """
+    if remission_states is None:
+        remission_states = REMISSION_STATES
+    active_states = [s.value for s in P.HealthStates
+                     if s.value not in remission_states and s != P.HealthStates.DEATH]
+
+    counts = []
+    for chunk in _get_chunks(trajectories, chunk_size):
+        if_relapse = np.isin(chunk[:, :-1], remission_states) & np.isin(chunk[:, 1:], active_states)
+        counts.append(if_relapse.sum(axis=1))
+    return np.concatenate(counts)
+
+
+def get_state_occupancy(trajectories, chunk_size=100000):
+    """ :returns (array of shape (time-steps + 1, states)) number of patients in each state at each time-step
+    :param trajectories: recorded trajectories (see load_trajectories)
+    :param chunk_size: number of patients read from the file at a time
+    """
+    n_states = len(P.HealthStates)
+    occupancy = np.zeros((trajectories.shape[1], n_states), dtype=np.int64)
+    for chunk in _get_chunks(trajectories, chunk_size):
+        # count states of all time-steps together (state + n_states * time-step)
+        codes = chunk.astype(np.int64) + n_states * np.arange(chunk.shape[1])
+        occupancy += np.bincount(codes.ravel(), minlength=occupancy.size).reshape(occupancy.shape)
+    return occupancy
+
+
+def _get_chunks(trajectories, chunk_size):
+    """ :returns a generator of chunks of rows of trajectories (read from the file one chunk at a time) """
+    for start in range(0, len(trajectories), chunk_size):
+        yield np.asarray(trajectories[start:start + chunk_size])